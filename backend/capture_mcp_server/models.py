@@ -1,7 +1,7 @@
 import uuid
 from django.db import models
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from typing import TYPE_CHECKING
 
@@ -45,10 +45,13 @@ class MCPUrl(models.Model):
     @property
     def mcp_url(self) -> str:
         """Generate the full MCP URL for this token."""
-        from django.conf import settings
+        return self.build_mcp_url(self.url_token)
 
+    @staticmethod
+    def build_mcp_url(url_token: str) -> str:
+        """Generate the full MCP URL for a token without loading the row."""
         base_url = getattr(settings, "MCP_BASE_URL", "http://localhost:8000")
-        return f"{base_url}/mcp/{self.url_token}/"
+        return f"{base_url}/mcp/{url_token}/"
 
     @classmethod
     def get_or_create_for_user(cls, user: "CustomUser") -> "MCPUrl":
@@ -64,3 +67,12 @@ def create_mcp_url_for_user(sender, instance, created, **kwargs) -> None:
     """Automatically create an MCP URL when a new user is created."""
     if created:
         MCPUrl.objects.create(user=instance, is_active=True)
+
+
+@receiver(post_save, sender=MCPUrl)
+@receiver(post_delete, sender=MCPUrl)
+def invalidate_mcp_token(sender, instance, **kwargs) -> None:
+    """Drop the cached token lookup whenever an MCP URL changes."""
+    from capture_mcp_server.token_cache import mcp_token_cache
+
+    mcp_token_cache.invalidate(instance.url_token)
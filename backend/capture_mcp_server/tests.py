@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from captures.blob_cache import blob_cache
+from captures.models import Capture
+from users.models import CustomUser
+from .token_cache import mcp_token_cache
+
+
+class MCPUrlTokenTests(TestCase):
+    """MCP requests are authorized by their URL token and scoped to its owner."""
+
+    def setUp(self):
+        cache.clear()
+        blob_cache.clear()
+        mcp_token_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        self.other_user = CustomUser.objects.create_user(
+            username="other@example.com", email="other@example.com", password="x"
+        )
+        self.mcp_url = self.user.mcp_urls.get()
+
+        blob_cache.set("captures/page.html", b"<p>Hello</p>")
+        self.capture = Capture.objects.create(
+            user=self.user,
+            website_url="https://example.com",
+            token_count=1,
+            html_file_key="captures/page.html",
+        )
+        self.other_capture = Capture.objects.create(
+            user=self.other_user,
+            website_url="https://example.com",
+            token_count=1,
+            html_file_key="captures/page.html",
+        )
+
+    def call_tool(self, url_token, capture):
+        return self.client.post(
+            reverse("capture_mcp_server:mcp_server", args=[url_token]),
+            {
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "tools/call",
+                "params": {
+                    "name": "get_html_for_reference",
+                    "arguments": {"capture_slug": str(capture.slug)},
+                },
+            },
+            content_type="application/json",
+            HTTP_ACCEPT="application/json, text/event-stream",
+        )
+
+    def test_tool_call_reads_own_capture(self):
+        response = self.call_tool(self.mcp_url.url_token, self.capture)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["result"]["content"][0]["text"], "<p>Hello</p>"
+        )
+
+    def test_tool_call_cannot_read_other_users_capture(self):
+        response = self.call_tool(self.mcp_url.url_token, self.other_capture)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["result"]["isError"])
+        self.assertIn(
+            "Capture not found", response.json()["result"]["content"][0]["text"]
+        )
+
+    def test_tool_call_cannot_read_archived_capture(self):
+        Capture.objects.filter(pk=self.capture.pk).update(archived=True)
+
+        response = self.call_tool(self.mcp_url.url_token, self.capture)
+
+        self.assertTrue(response.json()["result"]["isError"])
+        self.assertIn(
+            "Capture not found", response.json()["result"]["content"][0]["text"]
+        )
+
+    def test_unknown_token_is_rejected_and_cached(self):
+        response = self.call_tool("not-a-token", self.capture)
+        self.assertEqual(response.status_code, 404)
+
+        with self.assertNumQueries(0):
+            response = self.call_tool("not-a-token", self.capture)
+        self.assertEqual(response.status_code, 404)
+
+    def test_token_lookup_is_cached(self):
+        url_token = self.mcp_url.url_token
+        mcp_token_cache.get_user_id(url_token)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(mcp_token_cache.get_user_id(url_token), self.user.pk)
+
+    def test_deactivated_token_is_rejected(self):
+        self.call_tool(self.mcp_url.url_token, self.capture)
+
+        self.mcp_url.is_active = False
+        self.mcp_url.save()
+
+        response = self.call_tool(self.mcp_url.url_token, self.capture)
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,87 @@
+"""
+In-process cache of MCP URL tokens.
+Maps the url_token of each MCP request to the user owning the active MCPUrl,
+and remembers unknown tokens too, so the MCP hot path does not query the
+database per request.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MCPTokenCache:
+    """TTL cache of url_token -> user id, with negative entries, bounded in size."""
+
+    def __init__(self, ttl, negative_ttl, max_entries):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        # url_token -> (user id or None, expiry on the monotonic clock)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """Create a cache configured from the MCP_TOKEN_CACHE_* settings."""
+        return cls(
+            ttl=settings.MCP_TOKEN_CACHE_TTL,
+            negative_ttl=settings.MCP_TOKEN_CACHE_NEGATIVE_TTL,
+            max_entries=settings.MCP_TOKEN_CACHE_MAX_ENTRIES,
+        )
+
+    def get_user_id(self, url_token):
+        """
+        Get the user an MCP URL token belongs to.
+
+        Args:
+            url_token (str): The token from the MCP URL
+
+        Returns:
+            int: The id of the active user owning the active MCPUrl, or None
+                if the token is unknown or deactivated
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(url_token)
+            if entry is not None and entry[1] > now:
+                self._items.move_to_end(url_token)
+                return entry[0]
+
+        user_id = self._lookup(url_token)
+        ttl = self.ttl if user_id is not None else self.negative_ttl
+        with self._lock:
+            self._items[url_token] = (user_id, now + ttl)
+            self._items.move_to_end(url_token)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return user_id
+
+    def invalidate(self, url_token):
+        """Forget a token, e.g. after its MCPUrl was changed in this process."""
+        with self._lock:
+            self._items.pop(url_token, None)
+
+    def clear(self):
+        """Forget all tokens."""
+        with self._lock:
+            self._items.clear()
+
+    def _lookup(self, url_token):
+        from capture_mcp_server.models import MCPUrl
+
+        return (
+            MCPUrl.objects.filter(
+                url_token=url_token, is_active=True, user__is_active=True
+            )
+            .values_list("user_id", flat=True)
+            .first()
+        )
+
+
+mcp_token_cache = MCPTokenCache.from_settings()
@@ -1,33 +1,180 @@
-import boto3
+import asyncio
 import base64
+import contextvars
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from mcp.types import ImageContent
+from django.db import close_old_connections
+from mcp.types import ImageContent, TextContent
 from mcp_server.djangomcp import DjangoMCP  # type: ignore[import-untyped]
 from mcp_server.views import MCPServerStreamableHttpView  # type: ignore[import-untyped]
 from django.http import JsonResponse
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.permissions import AllowAny
-from asgiref.sync import sync_to_async
 
+from captures.html_service import (
+    CHARS_PER_TOKEN,
+    HTMLChunkService,
+    HTMLReductionService,
+)
+from captures.image_service import ImageVariantService
 from captures.models import Capture
+from captures.utils import get_capture_html, get_s3_bytes
+from .token_cache import mcp_token_cache
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-s3_client = boto3.client("s3", region_name=settings.AWS_S3_REGION_NAME)
-
 # Create a custom MCP server instance
 capture_mcp_server = DjangoMCP(name="website-to-mcp", stateless=True)
 
+# Bounded pool for blocking S3 and image work, so concurrent tool calls do
+# not queue behind each other on the thread-sensitive sync_to_async executor
+mcp_io_executor = ThreadPoolExecutor(
+    max_workers=settings.MCP_IO_WORKERS, thread_name_prefix="mcp-io"
+)
+
+
+# Owner of the MCP URL the current request came in on; tool calls only see
+# this user's captures
+mcp_user_id: contextvars.ContextVar[int | None] = contextvars.ContextVar(
+    "mcp_user_id", default=None
+)
+
+
+async def get_user_capture(capture_slug):
+    """
+    Get an unarchived capture of the user whose MCP URL is being served.
+
+    Archived captures stay hidden even while their files are still shared
+    with other captures or cached.
+
+    Raises:
+        Capture.DoesNotExist: If the slug does not name one of their captures
+    """
+    user_id = mcp_user_id.get()
+    if user_id is None:
+        raise Capture.DoesNotExist
+    return await Capture.objects.aget(
+        slug=capture_slug, user_id=user_id, archived=False
+    )
+
+
+def call_with_connections(func, *args):
+    """
+    Call ``func`` on a pool thread, dropping stale database connections.
+
+    No request signals fire on the pool, so connections opened by the work
+    (e.g. the database cache backend) are checked here as a request would.
+    """
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args):
+    """Run a blocking call on the MCP I/O pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        mcp_io_executor, functools.partial(call_with_connections, func, *args)
+    )
+
+
+def load_reference_html(capture, max_tokens=None, raw=False):
+    """Get the HTML handed to agents, reduced unless ``raw`` is requested."""
+    if raw:
+        return get_capture_html(capture)
+    return HTMLReductionService().get_reduced_html(capture, max_tokens)
+
+
+def encode_image(file_key):
+    """Read an image from S3 (or the blob cache) and base64-encode it."""
+    return base64.b64encode(get_s3_bytes(file_key)).decode("utf-8")
+
+
+async def get_screenshot_image(capture):
+    """
+    Load a capture's screenshot as MCP image content.
+
+    The downscaled "mcp" WebP variant is preferred over the full-size PNG and
+    generated on first use.
+
+    Args:
+        capture (Capture): A ready capture with a screenshot
+
+    Returns:
+        ImageContent: The base64-encoded screenshot
+    """
+    file_key, mime_type = capture.png_file_key, "image/png"
+    image_service = ImageVariantService()
+    if image_service.supports_format("webp"):
+        try:
+            variant_key = capture.image_variants.get(
+                image_service.variant_name("mcp", "webp")
+            )
+            if not variant_key:
+                variant_key = await run_blocking(
+                    image_service.generate_variant, capture, "mcp", "webp"
+                )
+            file_key, mime_type = variant_key, "image/webp"
+        except Exception as e:
+            logger.warning(
+                f"Falling back to the original screenshot for capture {capture.slug}: {str(e)}"
+            )
+
+    # Get image content from S3, or the blob cache on repeat calls, and
+    # convert it to base64 for JSON serialization
+    base64_content = await run_blocking(encode_image, file_key)
+    return ImageContent(
+        type="image",
+        data=base64_content,
+        mimeType=mime_type,
+    )
+
+
+async def load_chunk_index(capture):
+    """
+    Get the HTML chunk index of a capture, splitting the HTML on first use.
+
+    Args:
+        capture (Capture): A ready capture with HTML
+
+    Returns:
+        list: The chunk index
+    """
+    chunk_service = HTMLChunkService()
+    if not chunk_service.has_chunk_index(capture):
+        await run_blocking(chunk_service.generate_chunk_index, capture)
+    return capture.html_chunks["chunks"]
+
+
+async def get_ready_capture(capture_slug):
+    """Get a ready capture that has HTML, raising ValueError otherwise."""
+    capture = await get_user_capture(capture_slug)
+
+    if capture.status != Capture.Status.READY:
+        raise ValueError(f"Capture is not ready yet (status: {capture.status})")
+
+    if not capture.html_file_key:
+        raise ValueError("HTML file not found for this capture")
+
+    return capture
+
 
 @capture_mcp_server.tool()
-async def get_html_for_reference(capture_slug: str) -> str:
+async def get_html_for_reference(
+    capture_slug: str, max_tokens: int | None = None, raw: bool = False
+) -> str:
     """
-    Get HTML code for a specific capture. This should only be called once. Then you should call get_screenshot_for_reference to get the screenshot. The class names used int eh reference wont be available in the current project. Hence do not rely on them. Create new classes based on the style attributes. Do not use inline styles in the generated code. Ignore the data attributes.
+    Get HTML code for a specific capture. This should only be called once. Then you should call get_screenshot_for_reference to get the screenshot (or call get_capture_reference instead to get both at once). For very large pages, read the HTML with list_html_chunks and get_html_chunk instead. The class names used int eh reference wont be available in the current project. Hence do not rely on them. Create new classes based on the style attributes. Do not use inline styles in the generated code. Ignore the data attributes.
 
     Args:
         capture_slug: The UUID slug of the capture
+        max_tokens: Optional budget for the HTML; trailing parts of the page are cut to fit
+        raw: Return the HTML exactly as captured, including scripts, comments and data attributes
 
     Returns:
         The HTML content of the capture
@@ -37,19 +184,14 @@ async def get_html_for_reference(capture_slug: str) -> str:
     if not capture_slug:
         raise ValueError("capture_slug parameter is required")
 
-    try:
-        # Get the capture by slug only (UUIDs are unguessable)
-        capture = await sync_to_async(Capture.objects.get)(slug=capture_slug)
-
-        if not capture.html_file_key:
-            raise ValueError("HTML file not found for this capture")
+    if max_tokens is not None and max_tokens <= 0:
+        raise ValueError("max_tokens must be a positive number")
 
-        # Get HTML content from S3 (async)
-        response = await sync_to_async(s3_client.get_object)(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=capture.html_file_key
-        )
+    try:
+        capture = await get_ready_capture(capture_slug)
 
-        html_content = response["Body"].read().decode("utf-8")
+        # Get the reduced HTML from the cache, or from S3 on first use
+        html_content = await run_blocking(load_reference_html, capture, max_tokens, raw)
         logger.debug(
             f"Successfully retrieved HTML for capture {capture_slug}, length: {len(html_content)}"
         )
@@ -72,7 +214,7 @@ async def get_screenshot_for_reference(capture_slug: str) -> ImageContent:
         capture_slug: The UUID slug of the capture
 
     Returns:
-        The PNG image data as base64-encoded string
+        The screenshot (downscaled to suit vision models) as base64-encoded data
     """
     if not capture_slug:
         raise ValueError("capture_slug parameter is required")
@@ -80,38 +222,165 @@ async def get_screenshot_for_reference(capture_slug: str) -> ImageContent:
     logger.debug(f"get_screenshot_for_reference called for capture {capture_slug}")
 
     try:
-        # Get the capture by slug only (UUIDs are unguessable)
-        capture = await sync_to_async(Capture.objects.get)(slug=capture_slug)
+        capture = await get_user_capture(capture_slug)
+
+        if capture.status != Capture.Status.READY:
+            raise ValueError(f"Capture is not ready yet (status: {capture.status})")
 
         if not capture.png_file_key:
             raise ValueError("Screenshot file not found for this capture")
 
-        # Get PNG content from S3 (async)
-        response = await sync_to_async(s3_client.get_object)(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=capture.png_file_key
+        image = await get_screenshot_image(capture)
+        logger.debug(
+            f"Successfully retrieved screenshot for capture {capture_slug}, size: {len(image.data)} base64 bytes"
+        )
+        return image
+
+    except Capture.DoesNotExist:
+        logger.warning(f"Capture {capture_slug} not found")
+        raise ValueError("Capture not found")
+    except Exception as e:
+        logger.error(
+            f"Error retrieving screenshot for capture {capture_slug}: {str(e)}"
         )
+        raise ValueError(f"Error retrieving screenshot: {str(e)}")
+
 
-        png_content = response["Body"].read()
+@capture_mcp_server.tool(structured_output=False)
+async def get_capture_reference(
+    capture_slug: str, max_tokens: int | None = None, raw: bool = False
+) -> list[TextContent | ImageContent]:
+    """
+    Get the HTML code and the screenshot of a capture in a single call. Prefer this over calling get_html_for_reference and get_screenshot_for_reference one after the other. The class names used in the reference wont be available in the current project. Hence do not rely on them. Create new classes based on the style attributes. Do not use inline styles in the generated code. Ignore the data attributes.
+
+    Args:
+        capture_slug: The UUID slug of the capture
+        max_tokens: Optional budget for the HTML; trailing parts of the page are cut to fit
+        raw: Return the HTML exactly as captured, including scripts, comments and data attributes
 
-        # Convert to base64 for JSON serialization
-        base64_content = base64.b64encode(png_content).decode("utf-8")
+    Returns:
+        The HTML content of the capture, followed by its screenshot
+    """
+    if not capture_slug:
+        raise ValueError("capture_slug parameter is required")
+
+    if max_tokens is not None and max_tokens <= 0:
+        raise ValueError("max_tokens must be a positive number")
+
+    logger.debug(f"get_capture_reference called for capture {capture_slug}")
+
+    try:
+        capture = await get_ready_capture(capture_slug)
+
+        # Fetch the HTML and the screenshot concurrently
+        if capture.png_file_key:
+            html_content, image = await asyncio.gather(
+                run_blocking(load_reference_html, capture, max_tokens, raw),
+                get_screenshot_image(capture),
+            )
+        else:
+            html_content = await run_blocking(
+                load_reference_html, capture, max_tokens, raw
+            )
+            image = None
+
+        content: list[TextContent | ImageContent] = [
+            TextContent(type="text", text=html_content)
+        ]
+        if image is not None:
+            content.append(image)
         logger.debug(
-            f"Successfully retrieved screenshot for capture {capture_slug}, size: {len(png_content)} bytes"
-        )
-        return ImageContent(
-            type="image",
-            data=base64_content,
-            mimeType="image/png",
+            f"Successfully retrieved reference for capture {capture_slug}, HTML length: {len(html_content)}"
         )
+        return content
+
+    except Capture.DoesNotExist:
+        logger.warning(f"Capture {capture_slug} not found")
+        raise ValueError("Capture not found")
+    except Exception as e:
+        logger.error(f"Error retrieving reference for capture {capture_slug}: {str(e)}")
+        raise ValueError(f"Error retrieving reference: {str(e)}")
+
+
+@capture_mcp_server.tool()
+async def list_html_chunks(capture_slug: str) -> dict:
+    """
+    List the chunks the reduced HTML of a capture is split into, for pages too large to read in one call. Each chunk is a consecutive part of the document, cut between elements, and starts inside the element at its DOM path. Read them in order with get_html_chunk, or jump to the part of the page you need.
+
+    Args:
+        capture_slug: The UUID slug of the capture
+
+    Returns:
+        The number of chunks, and the index, DOM path and approximate token count of each
+    """
+    if not capture_slug:
+        raise ValueError("capture_slug parameter is required")
+
+    logger.debug(f"list_html_chunks called for capture {capture_slug}")
+
+    try:
+        capture = await get_ready_capture(capture_slug)
+        chunks = await load_chunk_index(capture)
+        return {
+            "chunk_count": len(chunks),
+            "chunks": [
+                {
+                    "index": index,
+                    "path": chunk["path"],
+                    "tokens": (chunk["end"] - chunk["start"]) // CHARS_PER_TOKEN,
+                }
+                for index, chunk in enumerate(chunks)
+            ],
+        }
+
+    except Capture.DoesNotExist:
+        logger.warning(f"Capture {capture_slug} not found")
+        raise ValueError("Capture not found")
+    except Exception as e:
+        logger.error(f"Error listing HTML chunks for capture {capture_slug}: {str(e)}")
+        raise ValueError(f"Error listing HTML chunks: {str(e)}")
+
+
+@capture_mcp_server.tool()
+async def get_html_chunk(capture_slug: str, index: int = 0) -> dict:
+    """
+    Get one chunk of the reduced HTML of a capture. Start at index 0 and keep calling with next_index until it is null to read the whole page.
+
+    Args:
+        capture_slug: The UUID slug of the capture
+        index: Position of the chunk, starting at 0
+
+    Returns:
+        The chunk's HTML and DOM path, the number of chunks and the index of the next chunk
+    """
+    if not capture_slug:
+        raise ValueError("capture_slug parameter is required")
+
+    logger.debug(f"get_html_chunk called for capture {capture_slug}, index {index}")
+
+    try:
+        capture = await get_ready_capture(capture_slug)
+        chunks = await load_chunk_index(capture)
+        if not 0 <= index < len(chunks):
+            raise ValueError(f"Chunk index must be between 0 and {len(chunks) - 1}")
+
+        html_content = await run_blocking(HTMLChunkService().get_chunk, capture, index)
+        return {
+            "index": index,
+            "chunk_count": len(chunks),
+            "path": chunks[index]["path"],
+            "next_index": index + 1 if index + 1 < len(chunks) else None,
+            "html": html_content,
+        }
 
     except Capture.DoesNotExist:
         logger.warning(f"Capture {capture_slug} not found")
         raise ValueError("Capture not found")
     except Exception as e:
         logger.error(
-            f"Error retrieving screenshot for capture {capture_slug}: {str(e)}"
+            f"Error retrieving HTML chunk for capture {capture_slug}: {str(e)}"
         )
-        raise ValueError(f"Error retrieving screenshot: {str(e)}")
+        raise ValueError(f"Error retrieving HTML chunk: {str(e)}")
 
 
 class CaptureMCPServerView(MCPServerStreamableHttpView):
@@ -124,6 +393,19 @@ class CaptureMCPServerView(MCPServerStreamableHttpView):
     def dispatch(self, request, *args, **kwargs):
         logger.debug(f"MCP request received: {request.method} {request.path}")
 
+        # Resolve the URL token to its owner, from the token cache on the hot path
+        user_id = mcp_token_cache.get_user_id(kwargs.get("url_token"))
+        if user_id is None:
+            logger.warning(f"MCP request with unknown URL token on {request.path}")
+            return JsonResponse(
+                {
+                    "jsonrpc": "2.0",
+                    "id": None,
+                    "error": {"code": -32001, "message": "MCP URL not found"},
+                },
+                status=404,
+            )
+
         # Use our custom MCP server
         self.mcp_server = capture_mcp_server
 
@@ -131,8 +413,12 @@ class CaptureMCPServerView(MCPServerStreamableHttpView):
         if request.method == "GET":
             return self.handle_get_request(request, *args, **kwargs)
 
-        # Handle POST requests normally
-        return super().dispatch(request, *args, **kwargs)
+        # Handle POST requests normally, with tool calls scoped to the owner
+        context_token = mcp_user_id.set(user_id)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            mcp_user_id.reset(context_token)
 
     def handle_get_request(self, request, *args, **kwargs):
         """Handle GET requests to the MCP endpoint."""
@@ -5,22 +5,33 @@ Handles S3 file deletion and marking captures as archived.
 
 import boto3
 import logging
+from collections import Counter
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from captures.models import Capture
+from captures.blob_cache import blob_cache
+from captures.blob_service import BlobService
+from users.profile_cache import invalidate_profile
 
 logger = logging.getLogger(__name__)
 
 # Initialize S3 client
 s3_client = boto3.client("s3")
 
+# Capture fields refreshed once the rows being archived or deleted are locked
+LOCKED_FIELDS = ("status", "archived", "image_variants", "html_chunks")
+
 
 class ArchivalService:
     """Service for handling capture archival operations."""
 
     def __init__(self):
         self.s3_client = s3_client
+        self.blob_service = BlobService()
 
     def delete_s3_file(self, file_key):
         """
@@ -39,6 +50,7 @@ class ArchivalService:
             self.s3_client.delete_object(
                 Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key
             )
+            blob_cache.delete(file_key)
             logger.info(f"Successfully deleted S3 file: {file_key}")
             return True
         except Exception as e:
@@ -58,16 +70,30 @@ class ArchivalService:
         try:
             logger.info(f"Starting archival for capture {capture.slug}")
 
-            # Delete HTML file from S3
-            html_deleted = self.delete_s3_file(capture.html_file_key)
+            with transaction.atomic():
+                if not self._lock_captures([capture]) or capture.archived:
+                    return True
 
-            # Delete PNG file from S3
-            png_deleted = self.delete_s3_file(capture.png_file_key)
+                # Only ready captures hold a reference to their files
+                if capture.status == Capture.Status.READY:
+                    # Release HTML file (deleted from S3 once no capture references it)
+                    html_deleted = self.blob_service.release(capture.html_file_key)
 
-            # Mark as archived regardless of S3 deletion results
-            # (we want to mark as archived even if S3 deletion fails)
-            capture.archived = True
-            capture.save(update_fields=["archived"])
+                    # Release PNG file (deleted from S3 once no capture references it)
+                    png_deleted = self.blob_service.release(capture.png_file_key)
+
+                # Delete generated screenshot variants from S3
+                for variant_key in capture.image_variants.values():
+                    self.delete_s3_file(variant_key)
+
+                # Delete the reduced HTML read in chunks by MCP clients
+                self.delete_s3_file(capture.html_chunks.get("file_key"))
+
+                # Mark as archived regardless of S3 deletion results
+                # (we want to mark as archived even if S3 deletion fails)
+                capture.archived = True
+                capture.save(update_fields=["archived"])
+            invalidate_profile(capture.user_id)
 
             logger.info(f"Successfully archived capture {capture.slug}")
             return True
@@ -76,6 +102,122 @@ class ArchivalService:
             logger.error(f"Failed to archive capture {capture.slug}: {str(e)}")
             return False
 
+    def archive_captures(self, captures):
+        """
+        Archive several captures, deleting their S3 files in batches.
+
+        Args:
+            captures (list): The capture instances to archive
+
+        Returns:
+            list: Keys of S3 files that could not be deleted
+        """
+        with transaction.atomic():
+            captures = [
+                capture
+                for capture in self._lock_captures(captures)
+                if not capture.archived
+            ]
+            if not captures:
+                return []
+
+            failed = self.blob_service.release_many(self._artifact_keys(captures))
+
+            # Mark as archived regardless of S3 deletion results
+            Capture.objects.filter(pk__in=[capture.pk for capture in captures]).update(
+                archived=True
+            )
+        for capture in captures:
+            capture.archived = True
+        for user_id in {capture.user_id for capture in captures}:
+            invalidate_profile(user_id)
+
+        logger.info(f"Successfully archived {len(captures)} capture(s)")
+        return failed
+
+    def delete_captures(self, captures):
+        """
+        Delete several captures of their users and their S3 files.
+
+        Files of archived captures were already released on archival. The
+        captures keep counting against their users' limits, so deleting
+        them does not give quota back.
+
+        Args:
+            captures (list): The capture instances to delete
+
+        Returns:
+            list: Keys of S3 files that could not be deleted
+        """
+        with transaction.atomic():
+            captures = self._lock_captures(captures)
+            if not captures:
+                return []
+
+            failed = self.blob_service.release_many(
+                self._artifact_keys(
+                    [capture for capture in captures if not capture.archived]
+                )
+            )
+            deleted = Counter(
+                capture.user_id
+                for capture in captures
+                if capture.status != Capture.Status.FAILED
+            )
+            for user_id, count in deleted.items():
+                get_user_model().objects.filter(pk=user_id).update(
+                    deleted_capture_count=F("deleted_capture_count") + count
+                )
+            for capture in captures:
+                capture.keeps_capture_slot = True
+                capture.delete()
+        for user_id in {capture.user_id for capture in captures}:
+            invalidate_profile(user_id)
+
+        logger.info(f"Successfully deleted {len(captures)} capture(s)")
+        return failed
+
+    def _lock_captures(self, captures):
+        """
+        Lock the rows of captures and refresh the fields archival depends on.
+
+        The ingest worker marks a capture ready with a conditional UPDATE, and
+        screenshot variants and HTML chunks are recorded under the same row
+        lock, so whether a capture holds references to its files, and which
+        generated files it has, cannot change before the caller's transaction
+        ends.
+
+        Returns:
+            list: The captures that still exist
+        """
+        rows = {
+            row["pk"]: row
+            for row in Capture.objects.select_for_update()
+            .filter(pk__in=[capture.pk for capture in captures])
+            .order_by("pk")
+            .values("pk", *LOCKED_FIELDS)
+        }
+        locked = []
+        for capture in captures:
+            row = rows.get(capture.pk)
+            if row is not None:
+                for field in LOCKED_FIELDS:
+                    setattr(capture, field, row[field])
+                locked.append(capture)
+        return locked
+
+    def _artifact_keys(self, captures):
+        """List the S3 keys of the files, image variants and HTML chunks of captures."""
+        file_keys = []
+        for capture in captures:
+            # Pending and failed captures never took a reference to their
+            # files, which may be shared with other captures
+            if capture.status == Capture.Status.READY:
+                file_keys += [capture.html_file_key, capture.png_file_key]
+            file_keys += capture.image_variants.values()
+            file_keys.append(capture.html_chunks.get("file_key"))
+        return file_keys
+
     def get_captures_to_archive(self, days_old=7):
         """
         Get captures that are older than the specified number of days.
@@ -0,0 +1,222 @@
+"""
+Size-bounded cache for capture blobs fetched from S3.
+Keeps recently used objects in an in-process LRU and optionally spills them to
+a local directory shared by all workers on the host.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BlobCache:
+    """LRU cache of S3 object bytes keyed by file key, bounded by total size."""
+
+    def __init__(self, max_bytes, max_item_bytes, disk_dir="", disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk_size = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls):
+        """Create a cache configured from the CAPTURE_BLOB_CACHE_* settings."""
+        return cls(
+            max_bytes=settings.CAPTURE_BLOB_CACHE_MAX_BYTES,
+            max_item_bytes=settings.CAPTURE_BLOB_CACHE_MAX_ITEM_BYTES,
+            disk_dir=settings.CAPTURE_BLOB_CACHE_DIR,
+            disk_max_bytes=settings.CAPTURE_BLOB_CACHE_DISK_MAX_BYTES,
+        )
+
+    def accepts(self, size):
+        """Check whether an object of ``size`` bytes is worth caching."""
+        return size is not None and 0 <= size <= self.max_item_bytes
+
+    def get(self, key):
+        """
+        Get cached bytes for a file key.
+
+        Args:
+            key (str): The S3 key of the file
+
+        Returns:
+            bytes: The cached content, or None on a miss
+        """
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._set_memory(key, data)
+        return data
+
+    def set(self, key, data):
+        """
+        Store bytes for a file key, evicting least recently used entries.
+
+        Args:
+            key (str): The S3 key of the file
+            data (bytes): The object content
+        """
+        if not self.accepts(len(data)):
+            return
+        self._set_memory(key, data)
+        self._write_disk(key, data)
+
+    def delete(self, key):
+        """Drop a file key from every tier."""
+        with self._lock:
+            data = self._items.pop(key, None)
+            if data is not None:
+                self._size -= len(data)
+
+        path = self._disk_path(key)
+        if path:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                with self._lock:
+                    if self._disk_size is not None:
+                        self._disk_size -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        """Empty the in-process tier and reset the counters."""
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return hit/miss counters and current usage."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (
+                    round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0
+                ),
+                "items": len(self._items),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _set_memory(self, key, data):
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def _disk_path(self, key):
+        if not self.disk_dir:
+            return None
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, digest)
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Refresh the mtime so disk eviction is least-recently-used
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        path = self._disk_path(key)
+        if not path or len(data) > self.disk_max_bytes:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write blob cache file for {key}: {str(e)}")
+            return
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = self._scan_disk_size()
+            else:
+                self._disk_size += len(data)
+            over_budget = self._disk_size > self.disk_max_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _scan_disk_size(self):
+        total = 0
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith(".tmp-"):
+                    total += entry.stat().st_size
+        return total
+
+    def _evict_disk(self):
+        """Remove the least recently used files until the disk tier fits."""
+        try:
+            with os.scandir(self.disk_dir) as entries:
+                files = [
+                    (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                    for entry in entries
+                    if entry.is_file() and not entry.name.startswith(".tmp-")
+                ]
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+        with self._lock:
+            self._disk_size = total
+
+
+blob_cache = BlobCache.from_settings()
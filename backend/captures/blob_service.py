@@ -0,0 +1,226 @@
+"""
+Blob service for reference-counted capture artifacts.
+Every uploaded artifact is tracked by a Blob row. With content-addressed keys,
+captures with identical HTML or screenshots share a single S3 object, which is
+only deleted when the last capture referencing it is archived.
+"""
+
+import logging
+from collections import Counter
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from captures.blob_cache import blob_cache
+from captures.models import Blob
+from captures.utils import BLOB_KEY_PREFIX, s3_client, upload_many_to_s3
+
+logger = logging.getLogger(__name__)
+
+# Most keys S3 accepts in a single DeleteObjects request
+S3_DELETE_BATCH_SIZE = 1000
+
+
+def blob_file_key(sha256, extension):
+    """
+    Return the content-addressed S3 key for an artifact.
+
+    Args:
+        sha256 (str): Hex SHA-256 of the original content
+        extension (str): File extension, e.g. ".png" or ".html.gz"
+
+    Returns:
+        str: The S3 key
+    """
+    return f"{BLOB_KEY_PREFIX}{sha256[:2]}/{sha256}{extension}"
+
+
+class BlobService:
+    """Service for storing and releasing reference-counted artifacts."""
+
+    def acquire(self, file_key):
+        """
+        Take a reference to an existing blob.
+
+        Returns:
+            bool: True if the blob exists, so its upload can be skipped
+        """
+        return (
+            Blob.objects.filter(file_key=file_key).update(ref_count=F("ref_count") + 1)
+            == 1
+        )
+
+    def register(self, file_key, content_type, content_encoding=None):
+        """Record a reference to a freshly uploaded blob."""
+        try:
+            with transaction.atomic():
+                Blob.objects.create(
+                    file_key=file_key,
+                    content_type=content_type,
+                    content_encoding=content_encoding or "",
+                    ref_count=1,
+                )
+        except IntegrityError:
+            # Another capture uploaded the same content concurrently
+            self.acquire(file_key)
+
+    def store_many(self, uploads):
+        """
+        Upload artifacts, skipping any whose blob already exists.
+
+        Args:
+            uploads (dict): Maps a name to a
+                ``(content, file_key, content_type, content_encoding)`` tuple
+
+        Returns:
+            dict: Upload duration in milliseconds for each uploaded name
+
+        Raises:
+            serializers.ValidationError: If any upload fails
+        """
+        reused = [name for name, upload in uploads.items() if self.acquire(upload[1])]
+        pending = {
+            name: upload for name, upload in uploads.items() if name not in reused
+        }
+
+        try:
+            timings = upload_many_to_s3(pending)
+        except Exception:
+            for name in reused:
+                self.release(uploads[name][1])
+            raise
+
+        for content, file_key, content_type, content_encoding in pending.values():
+            self.register(file_key, content_type, content_encoding)
+
+        if reused:
+            logger.info(f"Reused {len(reused)} existing blob(s): {', '.join(reused)}")
+        return timings
+
+    def release(self, file_key):
+        """
+        Drop a reference to an artifact, deleting it once unreferenced.
+
+        Artifacts without a Blob row (stored before reference counting) are
+        deleted straight away.
+
+        Args:
+            file_key (str): The S3 key of the artifact
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not file_key:
+            return True
+
+        try:
+            with transaction.atomic():
+                blob = (
+                    Blob.objects.select_for_update().filter(file_key=file_key).first()
+                )
+                if blob is None:
+                    return self._delete_object(file_key)
+
+                if blob.ref_count > 1:
+                    Blob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") - 1)
+                    return True
+
+                # Delete the object while holding the row lock, so a concurrent
+                # capture of the same content either reuses the blob before
+                # this point or uploads it afresh afterwards
+                if not self._delete_object(file_key):
+                    Blob.objects.filter(pk=blob.pk).update(ref_count=0)
+                    return False
+                blob.delete()
+                return True
+        except Exception as e:
+            logger.error(f"Failed to release blob {file_key}: {str(e)}")
+            return False
+
+    def release_many(self, file_keys):
+        """
+        Drop one reference per listed key, batch-deleting unreferenced objects.
+
+        Args:
+            file_keys (list): S3 keys of the artifacts; a key listed twice
+                drops two references
+
+        Returns:
+            list: Keys whose objects could not be deleted
+        """
+        counts = Counter(file_key for file_key in file_keys if file_key)
+        if not counts:
+            return []
+
+        with transaction.atomic():
+            # Lock in key order so concurrent batches cannot deadlock
+            blobs = {
+                blob.file_key: blob
+                for blob in Blob.objects.select_for_update()
+                .filter(file_key__in=counts)
+                .order_by("file_key")
+            }
+
+            unreferenced = []
+            for file_key, count in counts.items():
+                blob = blobs.get(file_key)
+                if blob is not None and blob.ref_count > count:
+                    Blob.objects.filter(pk=blob.pk).update(
+                        ref_count=F("ref_count") - count
+                    )
+                else:
+                    unreferenced.append(file_key)
+
+            failed = self._delete_objects(unreferenced)
+            Blob.objects.filter(
+                file_key__in=[key for key in unreferenced if key not in failed]
+            ).delete()
+            Blob.objects.filter(file_key__in=failed).update(ref_count=0)
+
+        return sorted(failed)
+
+    def _delete_objects(self, file_keys):
+        """
+        Delete S3 objects with as few DeleteObjects calls as possible.
+
+        Returns:
+            set: Keys that could not be deleted
+        """
+        failed = set()
+        for start in range(0, len(file_keys), S3_DELETE_BATCH_SIZE):
+            batch = file_keys[start : start + S3_DELETE_BATCH_SIZE]
+            try:
+                response = s3_client.delete_objects(
+                    Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                    Delete={
+                        "Objects": [{"Key": file_key} for file_key in batch],
+                        "Quiet": True,
+                    },
+                )
+                errors = {error["Key"] for error in response.get("Errors", [])}
+            except Exception as e:
+                logger.error(f"Failed to delete {len(batch)} S3 files: {str(e)}")
+                errors = set(batch)
+
+            for file_key in batch:
+                if file_key in errors:
+                    logger.error(f"Failed to delete S3 file {file_key}")
+                else:
+                    blob_cache.delete(file_key)
+            failed |= errors
+
+        deleted = len(file_keys) - len(failed)
+        if deleted:
+            logger.info(f"Successfully deleted {deleted} S3 file(s)")
+        return failed
+
+    def _delete_object(self, file_key):
+        try:
+            s3_client.delete_object(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key
+            )
+            blob_cache.delete(file_key)
+            logger.info(f"Successfully deleted S3 file: {file_key}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete S3 file {file_key}: {str(e)}")
+            return False
@@ -15,3 +15,25 @@ class CaptureLimitExceededException(APIException):
         super().__init__(detail, code)
         self.remaining_captures = remaining_captures
         self.total_limit = total_limit
+
+
+class CaptureTooLargeException(APIException):
+    """Exception raised when a capture request body exceeds the size limit."""
+
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The capture is too large."
+    default_code = "capture_too_large"
+
+    def __init__(self, detail=None, code=None, max_bytes=None):
+        if detail is None and max_bytes is not None:
+            detail = f"Capture requests are limited to {max_bytes} bytes."
+        super().__init__(detail, code)
+        self.max_bytes = max_bytes
+
+
+class CaptureLengthRequiredException(APIException):
+    """Exception raised when a capture request does not declare its size."""
+
+    status_code = status.HTTP_411_LENGTH_REQUIRED
+    default_detail = "Capture requests must include a Content-Length header."
+    default_code = "length_required"
@@ -0,0 +1,456 @@
+"""
+HTML service for reducing captured pages before they are handed to agents.
+Strips scripts, comments, data-* attributes and redundant whitespace, and can
+truncate the document to a token budget by dropping whole DOM subtrees, or
+split it into chunks that are read one at a time.
+"""
+
+import html
+import logging
+import re
+from html.parser import HTMLParser
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from captures.archival_service import ArchivalService
+from captures.blob_cache import blob_cache
+from captures.models import Capture
+from captures.utils import get_capture_html, get_s3_object, upload_to_s3
+
+logger = logging.getLogger(__name__)
+
+# Bump when the reduction output changes, so stale cache entries are ignored
+REDUCTION_VERSION = 2
+
+# Rough size of a token in characters of HTML, used for max_tokens budgets
+CHARS_PER_TOKEN = 4
+
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+# Elements whose content is dropped along with the element
+STRIPPED_ELEMENTS = {"script", "noscript"}
+# Elements whose text is kept exactly as captured
+PREFORMATTED_ELEMENTS = {"pre", "textarea"}
+
+re_whitespace = re.compile(r"\s+")
+
+
+class Node:
+    """Element of the reduced document tree."""
+
+    def __init__(self, tag, attrs=None, parent=None):
+        self.tag = tag
+        self.attrs = attrs or []
+        self.parent = parent
+        self.children = []
+        self._size = None
+
+    def open_tag(self):
+        attrs = "".join(
+            f" {name}" if value is None else f' {name}="{html.escape(value)}"'
+            for name, value in self.attrs
+        )
+        return f"<{self.tag}{attrs}>"
+
+    def close_tag(self):
+        return "" if self.tag in VOID_ELEMENTS else f"</{self.tag}>"
+
+    def size(self):
+        """
+        Measure the serialized element and its subtree, memoized.
+
+        Only the lengths are kept, so truncation and chunking can size every
+        level of a large document without holding its HTML once per level.
+
+        Returns:
+            tuple: The length in characters and in UTF-8 bytes
+        """
+        if self._size is None:
+            chars = size_bytes = 0
+            for part in (self.open_tag(), self.close_tag(), *self.children):
+                if isinstance(part, str):
+                    chars += len(part)
+                    size_bytes += len(part.encode("utf-8"))
+                else:
+                    part_chars, part_bytes = part.size()
+                    chars += part_chars
+                    size_bytes += part_bytes
+            self._size = (chars, size_bytes)
+        return self._size
+
+    def to_html(self):
+        """Serialize the element and its subtree."""
+        parts = []
+        self.write_html(parts)
+        return "".join(parts)
+
+    def write_html(self, parts):
+        """Append the serialized element and its subtree to ``parts``."""
+        parts.append(self.open_tag())
+        for child in self.children:
+            if isinstance(child, str):
+                parts.append(child)
+            else:
+                child.write_html(parts)
+        parts.append(self.close_tag())
+
+
+class ReducingParser(HTMLParser):
+    """Build a tree of the document, leaving out everything agents ignore."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node(None)
+        self.current = self.root
+        # Stripped element whose content is being skipped, until its end tag
+        self.skipping = None
+        self.doctype = ""
+
+    def handle_decl(self, decl):
+        if decl.lower().startswith("doctype"):
+            self.doctype = f"<!{decl}>"
+
+    def handle_starttag(self, tag, attrs):
+        if self.skipping:
+            return
+        if tag in STRIPPED_ELEMENTS:
+            self.skipping = tag
+            return
+
+        attrs = [(name, value) for name, value in attrs if not name.startswith("data-")]
+        node = Node(tag, attrs, self.current)
+        self.current.children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        if self.skipping or tag in STRIPPED_ELEMENTS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        # Tags inside a stripped element may be unbalanced, so only its own
+        # end tag ends the skipped region
+        if self.skipping:
+            if tag == self.skipping:
+                self.skipping = None
+            return
+
+        # Close the nearest matching element, tolerating unclosed children
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        if self.current.tag == "style":
+            self.current.children.append(re_whitespace.sub(" ", data).strip())
+            return
+        if not self.in_preformatted():
+            data = re_whitespace.sub(" ", data)
+            children = self.current.children
+            if data == " " and (
+                not children
+                or (isinstance(children[-1], str) and children[-1].endswith(" "))
+            ):
+                return
+        self.current.children.append(html.escape(data, quote=False))
+
+    def in_preformatted(self):
+        node = self.current
+        while node is not self.root:
+            if node.tag in PREFORMATTED_ELEMENTS:
+                return True
+            node = node.parent
+        return False
+
+
+class HTMLReductionService:
+    """Service for producing reduced, optionally truncated, capture HTML."""
+
+    def reduce(self, content, max_tokens=None):
+        """
+        Reduce an HTML document.
+
+        Args:
+            content (str): The original HTML
+            max_tokens (int): Optional budget; whole subtrees past it are
+                dropped and replaced by a comment saying how many were cut
+
+        Returns:
+            str: The reduced HTML
+        """
+        parser = self.parse(content)
+        if max_tokens is None:
+            parts = []
+            for child in parser.root.children:
+                if isinstance(child, str):
+                    parts.append(child)
+                else:
+                    child.write_html(parts)
+            body = "".join(parts)
+        else:
+            budget = max(0, max_tokens * CHARS_PER_TOKEN - len(parser.doctype))
+            body, _ = self._truncate_children(parser.root.children, budget)
+        return parser.doctype + body.strip()
+
+    def parse(self, content):
+        """Parse an HTML document into a reduced tree, returning the parser."""
+        parser = ReducingParser()
+        parser.feed(content)
+        parser.close()
+        return parser
+
+    def get_reduced_html(self, capture, max_tokens=None):
+        """
+        Get the reduced HTML of a capture, cached per capture and budget.
+
+        Args:
+            capture (Capture): The capture to reduce
+            max_tokens (int): Optional token budget
+
+        Returns:
+            str: The reduced HTML
+        """
+        source = capture.html_sha256 or capture.slug
+        key = f"capture-html:v{REDUCTION_VERSION}:{source}:{max_tokens or 'full'}"
+        reduced = cache.get(key)
+        if reduced is None:
+            original = get_capture_html(capture)
+            reduced = self.reduce(original, max_tokens)
+            cache.set(key, reduced, settings.CAPTURE_REDUCED_HTML_CACHE_TTL)
+            logger.info(
+                f"Reduced HTML of capture {capture.slug} from {len(original)} to {len(reduced)} characters"
+            )
+        return reduced
+
+    def _truncate_children(self, children, budget):
+        """
+        Serialize as many children as fit in ``budget`` characters.
+
+        The first child that does not fit is descended into, so the output
+        ends with as much of that subtree as fits.
+
+        Returns:
+            tuple: The HTML and the number of characters left
+        """
+        parts = []
+        for index, child in enumerate(children):
+            size = len(child) if isinstance(child, str) else child.size()[0]
+            if size <= budget:
+                if isinstance(child, str):
+                    parts.append(child)
+                else:
+                    child.write_html(parts)
+                budget -= size
+                continue
+
+            if not isinstance(child, str):
+                partial, budget = self._truncate_element(child, budget)
+                parts.append(partial)
+
+            dropped = sum(
+                1 for sibling in children[index + 1 :] if not isinstance(sibling, str)
+            )
+            if dropped:
+                parts.append(f"<!-- truncated: {dropped} more element(s) -->")
+            break
+        return "".join(parts), budget
+
+    def _truncate_element(self, node, budget):
+        open_tag, close_tag = node.open_tag(), node.close_tag()
+        budget -= len(open_tag) + len(close_tag)
+        if budget < 0:
+            return "", budget + len(open_tag) + len(close_tag)
+
+        inner, budget = self._truncate_children(node.children, budget)
+        return f"{open_tag}{inner}{close_tag}", budget
+
+
+class HTMLChunkService:
+    """
+    Service for reading the reduced HTML of large captures chunk by chunk.
+
+    The reduced document is stored once under captures/<slug>/ and its chunk
+    index, the byte range and DOM path of each chunk, is recorded on the
+    capture, so a chunk is read with a ranged S3 request.
+    """
+
+    def chunk_file_key(self, capture):
+        """Return the S3 key of the reduced HTML the chunks are read from."""
+        return f"captures/{capture.slug}/html-reduced-v{REDUCTION_VERSION}.html"
+
+    def has_chunk_index(self, capture):
+        """Check whether the capture has a chunk index of the current version."""
+        return capture.html_chunks.get("version") == REDUCTION_VERSION
+
+    def generate_chunk_index(self, capture):
+        """
+        Split and upload the reduced HTML, and record its chunk index.
+
+        Returns:
+            list: The chunk index
+
+        Raises:
+            ValueError: If the capture was archived or deleted meanwhile
+        """
+        parser = HTMLReductionService().parse(get_capture_html(capture))
+        max_bytes = settings.CAPTURE_HTML_CHUNK_TOKENS * CHARS_PER_TOKEN
+        content, chunks = ChunkWriter(max_bytes).write(parser)
+
+        file_key = self.chunk_file_key(capture)
+        upload_to_s3(content, file_key, "text/html; charset=utf-8")
+        self.record_chunk_index(
+            capture,
+            {"version": REDUCTION_VERSION, "file_key": file_key, "chunks": chunks},
+        )
+        logger.info(f"Split HTML of capture {capture.slug} into {len(chunks)} chunk(s)")
+        return chunks
+
+    def record_chunk_index(self, capture, html_chunks):
+        """
+        Save ``capture.html_chunks`` in the database under a row lock.
+
+        Archival deletes the chunk file recorded on the locked row, so the
+        file of an archived or deleted capture is deleted here instead, and
+        the file of an older reduction version once it is replaced.
+
+        Raises:
+            ValueError: If the capture was archived or deleted meanwhile
+        """
+        archival_service = ArchivalService()
+        with transaction.atomic():
+            row = (
+                Capture.objects.select_for_update()
+                .filter(pk=capture.pk)
+                .values("html_chunks", "archived")
+                .first()
+            )
+            if row is None or row["archived"]:
+                archival_service.delete_s3_file(html_chunks["file_key"])
+                raise ValueError(f"Capture {capture.slug} is not available anymore")
+
+            Capture.objects.filter(pk=capture.pk).update(html_chunks=html_chunks)
+        capture.html_chunks = html_chunks
+
+        previous_file_key = row["html_chunks"].get("file_key")
+        if previous_file_key and previous_file_key != html_chunks["file_key"]:
+            archival_service.delete_s3_file(previous_file_key)
+
+    def get_chunk(self, capture, index):
+        """
+        Read one chunk of a capture's reduced HTML.
+
+        Args:
+            capture (Capture): A capture with a chunk index
+            index (int): Position of the chunk in the index
+
+        Returns:
+            str: The HTML of the chunk
+        """
+        file_key = capture.html_chunks["file_key"]
+        chunk = capture.html_chunks["chunks"][index]
+        cache_key = f"{file_key}#{chunk['start']}-{chunk['end']}"
+        data = blob_cache.get(cache_key)
+        if data is None:
+            byte_range = f"bytes={chunk['start']}-{chunk['end'] - 1}"
+            data = get_s3_object(file_key, byte_range)["Body"].read()
+            blob_cache.set(cache_key, data)
+        return data.decode("utf-8")
+
+
+class ChunkWriter:
+    """
+    Serialize a reduced document into chunks of at most ``max_bytes``.
+
+    Chunks are consecutive slices of the document, cut only between sibling
+    subtrees; an element too large for a chunk is opened and its children
+    are split in turn. Only a single oversized text node can exceed the limit.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.parts = []
+        self.chunks = []
+        self.position = 0
+        self.chunk_start = 0
+        self.chunk_path = "/"
+
+    def write(self, parser):
+        """
+        Serialize the tree of a ReducingParser.
+
+        Returns:
+            tuple: The encoded document and its chunk index
+        """
+        self.emit(parser.doctype)
+        self.write_children(parser.root.children, "")
+        self.cut("")
+        return b"".join(self.parts), self.chunks
+
+    def write_children(self, children, path):
+        positions = {}
+        for child in children:
+            if isinstance(child, str):
+                child_path = None
+                size = len(child.encode("utf-8"))
+            else:
+                positions[child.tag] = positions.get(child.tag, 0) + 1
+                child_path = f"{path}/{child.tag}[{positions[child.tag]}]"
+                size = child.size()[1]
+
+            # Start a new chunk for a subtree that fits into one, and open
+            # larger elements where the current chunk ends; a subtree is only
+            # serialized once it is written out
+            if child_path is None or size <= self.max_bytes:
+                if not self.fits(size):
+                    self.cut(path)
+                self.emit(child if isinstance(child, str) else child.to_html())
+                continue
+
+            self.emit(child.open_tag())
+            self.write_children(child.children, child_path)
+            close_tag = child.close_tag()
+            if not self.fits(len(close_tag)):
+                self.cut(child_path)
+            self.emit(close_tag)
+
+    def fits(self, size):
+        return self.position - self.chunk_start + size <= self.max_bytes
+
+    def emit(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.parts.append(data)
+        self.position += len(data)
+
+    def cut(self, path):
+        """End the current chunk here; the next one starts inside ``path``."""
+        if self.position > self.chunk_start:
+            self.chunks.append(
+                {
+                    "start": self.chunk_start,
+                    "end": self.position,
+                    "path": self.chunk_path,
+                }
+            )
+        self.chunk_start = self.position
+        self.chunk_path = path or "/"
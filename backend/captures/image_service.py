@@ -0,0 +1,162 @@
+"""
+Image service for screenshot variants.
+Generates downscaled, re-encoded copies of capture screenshots on first use and
+stores them next to the original under captures/<slug>/.
+"""
+
+import io
+import logging
+from django.conf import settings
+from django.db import transaction
+from captures.archival_service import ArchivalService
+from captures.blob_cache import blob_cache
+from captures.models import Capture
+from captures.utils import get_s3_bytes, upload_to_s3
+
+try:
+    from PIL import Image, features
+
+    PIL_AVAILABLE = True
+except ImportError:  # Pillow is installed as a dependency of matplotlib
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Pillow format names and MIME types of the supported variant encodings
+IMAGE_FORMATS = {
+    "avif": ("AVIF", "image/avif"),
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+}
+
+
+class ImageVariantService:
+    """Service for generating and locating screenshot variants."""
+
+    def is_available(self):
+        """Check whether images can be transcoded in this environment."""
+        return PIL_AVAILABLE
+
+    def supports_format(self, image_format):
+        """Check whether Pillow can encode ``image_format``."""
+        if not self.is_available() or image_format not in IMAGE_FORMATS:
+            return False
+        return image_format == "png" or bool(features.check(image_format))
+
+    def choose_format(self, accept_header):
+        """
+        Pick the preferred variant encoding the client accepts.
+
+        Args:
+            accept_header (str): The request's ``Accept`` header
+
+        Returns:
+            str: One of the CAPTURE_IMAGE_VARIANT_FORMATS, or "png"
+        """
+        for image_format in settings.CAPTURE_IMAGE_VARIANT_FORMATS:
+            mime_type = IMAGE_FORMATS.get(image_format, (None, None))[1]
+            if mime_type and mime_type in accept_header:
+                if self.supports_format(image_format):
+                    return image_format
+        return "png"
+
+    def variant_name(self, variant, image_format):
+        """Return the name under which a variant is recorded on the capture."""
+        return f"{variant}.{image_format}"
+
+    def content_type(self, image_format):
+        """Return the MIME type of a variant encoding."""
+        return IMAGE_FORMATS[image_format][1]
+
+    def get_variant(self, capture, variant, image_format):
+        """
+        Get the S3 key of a screenshot variant, generating it if needed.
+
+        Args:
+            capture (Capture): The capture whose screenshot to use
+            variant (str): One of the CAPTURE_IMAGE_VARIANTS names
+            image_format (str): One of the IMAGE_FORMATS names
+
+        Returns:
+            str: The S3 key of the variant
+        """
+        file_key = capture.image_variants.get(self.variant_name(variant, image_format))
+        if file_key:
+            return file_key
+
+        return self.generate_variant(capture, variant, image_format)
+
+    def generate_variant(self, capture, variant, image_format):
+        """
+        Generate and upload a screenshot variant and record it on the capture.
+
+        Returns:
+            str: The S3 key of the variant
+        """
+        name = self.variant_name(variant, image_format)
+        max_dimension = settings.CAPTURE_IMAGE_VARIANTS[variant]
+        content = self.transcode(
+            get_s3_bytes(capture.png_file_key), max_dimension, image_format
+        )
+        file_key = f"captures/{capture.slug}/screenshot-{variant}.{image_format}"
+        upload_to_s3(content, file_key, self.content_type(image_format))
+        # The variant is about to be served, so keep it close at hand
+        blob_cache.set(file_key, content)
+
+        self.record_variant(capture, name, file_key)
+        logger.info(f"Generated {name} screenshot variant for capture {capture.slug}")
+        return file_key
+
+    def record_variant(self, capture, name, file_key):
+        """
+        Add a variant to ``capture.image_variants`` in the database.
+
+        The stored dict is merged under a row lock rather than overwritten, so
+        variants generated concurrently by other requests are kept (archival
+        only deletes the variants recorded there).
+
+        Raises:
+            ValueError: If the capture was archived or deleted meanwhile, in
+                which case the variant is deleted again
+        """
+        with transaction.atomic():
+            row = (
+                Capture.objects.select_for_update()
+                .filter(pk=capture.pk)
+                .values("image_variants", "archived")
+                .first()
+            )
+            if row is None or row["archived"]:
+                ArchivalService().delete_s3_file(file_key)
+                raise ValueError(f"Capture {capture.slug} is not available anymore")
+
+            image_variants = row["image_variants"]
+            image_variants[name] = file_key
+            Capture.objects.filter(pk=capture.pk).update(image_variants=image_variants)
+        capture.image_variants = image_variants
+
+    def transcode(self, png_content, max_dimension, image_format):
+        """
+        Downscale an image to fit ``max_dimension`` and re-encode it.
+
+        Args:
+            png_content (bytes): The original screenshot
+            max_dimension (int): Maximum width and height in pixels
+            image_format (str): One of the IMAGE_FORMATS names
+
+        Returns:
+            bytes: The encoded variant
+        """
+        pil_format = IMAGE_FORMATS[image_format][0]
+        with Image.open(io.BytesIO(png_content)) as image:
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            if image_format != "png" and image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            output = io.BytesIO()
+            save_options = {}
+            if image_format == "png":
+                save_options["optimize"] = True
+            else:
+                save_options["quality"] = settings.CAPTURE_IMAGE_VARIANT_QUALITY
+            image.save(output, format=pil_format, **save_options)
+        return output.getvalue()
@@ -0,0 +1,258 @@
+"""
+Ingest service for asynchronous capture creation.
+Spools capture artifacts to local disk so the request can return immediately,
+then uploads them to S3 on a background worker pool.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from captures.models import Capture
+from captures.blob_service import BlobService
+from users.profile_cache import invalidate_profile
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+# Background pool that finishes spooled captures in this process
+ingest_executor = ThreadPoolExecutor(
+    max_workers=settings.CAPTURE_INGEST_WORKERS, thread_name_prefix="capture-ingest"
+)
+
+
+class IngestService:
+    """Service for spooling captures and completing their uploads."""
+
+    def __init__(self, spool_dir=None):
+        self.spool_dir = str(spool_dir or settings.CAPTURE_SPOOL_DIR)
+
+    def spool_path(self, slug):
+        """Return the spool directory of a capture."""
+        return os.path.join(self.spool_dir, slug)
+
+    def spool_capture(self, slug, uploads):
+        """
+        Durably write a capture's artifacts to the spool.
+
+        The files are written to a temporary directory which is renamed into
+        place, so a spooled capture is either complete or absent.
+
+        Args:
+            slug (str): The slug of the capture
+            uploads (dict): Maps a name to a
+                ``(content, file_key, content_type, content_encoding)`` tuple,
+                as accepted by ``upload_many_to_s3``
+        """
+        os.makedirs(self.spool_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.spool_dir, prefix=f".{slug}-")
+        try:
+            manifest: dict[str, Any] = {"attempts": 0, "files": {}}
+            for name, upload in uploads.items():
+                content, file_key, content_type, content_encoding = upload
+                with open(os.path.join(tmp_dir, name), "wb") as f:
+                    if hasattr(content, "read"):
+                        content.seek(0)
+                        shutil.copyfileobj(content, f)
+                    else:
+                        f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                manifest["files"][name] = {
+                    "file_key": file_key,
+                    "content_type": content_type,
+                    "content_encoding": content_encoding,
+                }
+            self._write_manifest(tmp_dir, manifest)
+            os.rename(tmp_dir, self.spool_path(slug))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def enqueue(self, slug):
+        """Process a spooled capture on the background pool once committed."""
+        transaction.on_commit(lambda: ingest_executor.submit(self._run, slug))
+
+    def _run(self, slug):
+        # Nothing reads the future, so errors must be logged here
+        try:
+            self.process_capture(slug)
+        except Exception:
+            logger.exception(f"Exception ingesting capture {slug}")
+        finally:
+            close_old_connections()
+
+    def claim_capture(self, slug):
+        """
+        Atomically move a capture from pending to processing.
+
+        Captures stuck in processing for longer than
+        CAPTURE_INGEST_STALE_AFTER seconds (e.g. after a worker crash) can be
+        claimed again.
+
+        Returns:
+            bool: True if this caller now owns the capture
+        """
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=settings.CAPTURE_INGEST_STALE_AFTER)
+        claimed = (
+            Capture.objects.filter(slug=slug, archived=False)
+            .filter(
+                Q(status=Capture.Status.PENDING)
+                | Q(status=Capture.Status.PROCESSING, updated_at__lt=stale_before)
+            )
+            .update(status=Capture.Status.PROCESSING, updated_at=now)
+        )
+        return claimed == 1
+
+    def process_capture(self, slug):
+        """
+        Upload a spooled capture to S3 and mark it ready.
+
+        Failed uploads are retried on later runs until
+        CAPTURE_INGEST_MAX_ATTEMPTS is reached, after which the capture is
+        marked failed.
+
+        Args:
+            slug (str): The slug of the capture
+
+        Returns:
+            bool: True if the capture is now ready
+        """
+        path = self.spool_path(slug)
+        if not os.path.isdir(path):
+            logger.warning(f"No spooled files found for capture {slug}")
+            return False
+
+        if not self.claim_capture(slug):
+            self._discard_if_orphaned(slug, path)
+            return False
+
+        manifest = self._read_manifest(path)
+        uploads = {}
+        error = None
+        try:
+            # Stream the spooled files to S3 instead of reading them into memory
+            for name, entry in manifest["files"].items():
+                uploads[name] = (
+                    open(os.path.join(path, name), "rb"),
+                    entry["file_key"],
+                    entry["content_type"],
+                    entry.get("content_encoding"),
+                )
+            BlobService().store_many(uploads)
+        except Exception as e:
+            error = e
+        finally:
+            for f, _, _, _ in uploads.values():
+                f.close()
+
+        if error is not None:
+            manifest["attempts"] += 1
+            logger.error(
+                f"Upload attempt {manifest['attempts']} failed for capture {slug}: {str(error)}"
+            )
+            if manifest["attempts"] >= settings.CAPTURE_INGEST_MAX_ATTEMPTS:
+                self._mark_failed(slug)
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                self._write_manifest(path, manifest)
+                Capture.objects.filter(slug=slug).update(
+                    status=Capture.Status.PENDING, updated_at=timezone.now()
+                )
+            return False
+
+        # The capture only keeps the references taken above if it is still
+        # ours to finish. This UPDATE waits for an archival or delete holding
+        # the row lock, which releases the references of ready captures only
+        ready = Capture.objects.filter(
+            slug=slug, status=Capture.Status.PROCESSING, archived=False
+        ).update(status=Capture.Status.READY, updated_at=timezone.now())
+        shutil.rmtree(path, ignore_errors=True)
+        if not ready:
+            logger.warning(
+                f"Capture {slug} was archived, deleted or finished elsewhere during ingest"
+            )
+            BlobService().release_many(
+                [file_key for _, file_key, _, _ in uploads.values()]
+            )
+            return False
+
+        logger.info(f"Finished ingesting capture {slug}")
+        return True
+
+    def process_spool(self):
+        """
+        Process every capture left in the spool, e.g. after a restart.
+
+        Returns:
+            dict: Summary of the run
+        """
+        if not os.path.isdir(self.spool_dir):
+            slugs = []
+        else:
+            slugs = [
+                name
+                for name in os.listdir(self.spool_dir)
+                if not name.startswith(".")
+                and os.path.isdir(os.path.join(self.spool_dir, name))
+            ]
+
+        processed = 0
+        for slug in slugs:
+            try:
+                if self.process_capture(slug):
+                    processed += 1
+            except Exception as e:
+                logger.error(f"Exception ingesting capture {slug}: {str(e)}")
+
+        return {"spooled_captures": len(slugs), "processed_captures": processed}
+
+    def _mark_failed(self, slug):
+        """Mark a claimed capture failed and give its quota slot back."""
+        capture = Capture.objects.select_related("user").filter(slug=slug).first()
+        if capture is None:
+            return
+
+        failed = Capture.objects.filter(
+            pk=capture.pk, status=Capture.Status.PROCESSING
+        ).update(status=Capture.Status.FAILED, updated_at=timezone.now())
+        if failed:
+            # Failed captures do not count against the user's quota
+            capture.user.release_capture_slot()
+            invalidate_profile(capture.user_id)
+            logger.warning(f"Gave up ingesting capture {slug}")
+
+    def _discard_if_orphaned(self, slug, path):
+        """Remove a spool entry whose capture is done, archived or was never saved."""
+        status, archived = Capture.objects.filter(slug=slug).values_list(
+            "status", "archived"
+        ).first() or (None, False)
+        if archived or status in (Capture.Status.READY, Capture.Status.FAILED):
+            shutil.rmtree(path, ignore_errors=True)
+        elif status is None:
+            age = timezone.now().timestamp() - os.path.getmtime(path)
+            if age > settings.CAPTURE_INGEST_STALE_AFTER:
+                logger.warning(f"Discarding spool of unknown capture {slug}")
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            logger.info(f"Capture {slug} is already being processed")
+
+    def _read_manifest(self, path):
+        with open(os.path.join(path, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, path, manifest):
+        tmp_path = os.path.join(path, f".{MANIFEST_NAME}")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(path, MANIFEST_NAME))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from captures.ingest_service import IngestService
+
+
+class Command(BaseCommand):
+    help = "Upload captures left in the ingest spool (e.g. after a restart)."
+
+    def handle(self, *args, **options):
+        summary = IngestService().process_spool()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {summary['processed_captures']} of "
+                f"{summary['spooled_captures']} spooled captures"
+            )
+        )
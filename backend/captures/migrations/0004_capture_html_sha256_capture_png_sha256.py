@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("captures", "0003_alter_capture_website_url"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capture",
+            name="html_sha256",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="capture",
+            name="png_sha256",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
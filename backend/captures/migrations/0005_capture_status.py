@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("captures", "0004_capture_html_sha256_capture_png_sha256"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capture",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("processing", "Processing"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                default="ready",
+                max_length=20,
+            ),
+        ),
+    ]
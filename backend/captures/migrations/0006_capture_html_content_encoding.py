@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("captures", "0005_capture_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capture",
+            name="html_content_encoding",
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
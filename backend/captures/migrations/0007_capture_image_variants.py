@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("captures", "0006_capture_html_content_encoding"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capture",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-17 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("captures", "0007_capture_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("file_key", models.CharField(max_length=500, unique=True)),
+                ("content_type", models.CharField(max_length=100)),
+                ("content_encoding", models.CharField(blank=True, max_length=20)),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "capture_blobs",
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("captures", "0008_blob"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="capture",
+            index=models.Index(
+                fields=["user", "archived", "-created_at"],
+                name="captures_user_list_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="capture",
+            index=models.Index(
+                fields=["archived", "created_at"], name="captures_archival_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="capture",
+            index=models.Index(
+                condition=models.Q(("archived", False)),
+                fields=["user", "-created_at"],
+                name="captures_user_active_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="capture",
+            index=models.Index(
+                condition=models.Q(("archived", False)),
+                fields=["created_at"],
+                name="captures_active_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="capture",
+            index=models.Index(
+                fields=["created_at", "user"], name="captures_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("captures", "0009_capture_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capture",
+            name="html_chunks",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,11 +1,21 @@
 import uuid
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.conf import settings
+from django.contrib.auth import get_user_model
 
 
 class Capture(models.Model):
     """Model for storing website captures with HTML, PNG, and metadata."""
 
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        READY = "ready", "Ready"
+        FAILED = "failed", "Failed"
+
     # Generate a unique slug using UUID
     slug = models.CharField(
         max_length=36, unique=True, default=uuid.uuid4, editable=False
@@ -26,6 +36,25 @@ class Capture(models.Model):
     html_file_key = models.CharField(max_length=500, blank=True)
     png_file_key = models.CharField(max_length=500, blank=True)
 
+    # Generated screenshot variants, e.g. {"thumb.webp": "captures/<slug>/..."}
+    image_variants = models.JSONField(default=dict, blank=True)
+
+    # Chunk index of the reduced HTML read by MCP clients page by page, e.g.
+    # {"version": 1, "file_key": "captures/<slug>/...", "chunks": [...]}
+    html_chunks = models.JSONField(default=dict, blank=True)
+
+    # Storage encoding of the HTML object ("gzip", or empty when uncompressed)
+    html_content_encoding = models.CharField(max_length=20, blank=True)
+
+    # SHA-256 of the stored content, used as a strong ETag
+    html_sha256 = models.CharField(max_length=64, blank=True)
+    png_sha256 = models.CharField(max_length=64, blank=True)
+
+    # Ingestion status (captures created asynchronously start as pending)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.READY
+    )
+
     # Archive status
     archived = models.BooleanField(default=False)
 
@@ -36,6 +65,36 @@ class Capture(models.Model):
     class Meta:
         ordering = ["-created_at"]
         db_table = "captures"
+        indexes = [
+            # A user's unarchived captures, newest first (CaptureListView)
+            models.Index(
+                fields=["user", "archived", "-created_at"],
+                name="captures_user_list_idx",
+            ),
+            # Unarchived captures older than a cutoff (ArchivalService)
+            models.Index(
+                fields=["archived", "created_at"], name="captures_archival_idx"
+            ),
+            # Partial versions of the two indexes above. Only unarchived
+            # captures are indexed, and SQLite can only match "NOT archived"
+            # against a partial index. MySQL skips these (models.W037) and
+            # uses the composite indexes instead
+            models.Index(
+                fields=["user", "-created_at"],
+                condition=models.Q(archived=False),
+                name="captures_user_active_idx",
+            ),
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(archived=False),
+                name="captures_active_created_idx",
+            ),
+            # Captures and distinct users in a date range (MetricsService)
+            models.Index(fields=["created_at", "user"], name="captures_created_idx"),
+        ]
+
+    # Set on instances deleted by their user, whose slot is not given back
+    keeps_capture_slot = False
 
     def __str__(self) -> str:
         return f"Capture {self.slug} - {self.website_url}"
@@ -45,3 +104,43 @@ class Capture(models.Model):
         if not self.slug:
             self.slug = str(uuid.uuid4())
         super().save(*args, **kwargs)
+
+
+@receiver(post_delete, sender=Capture)
+def decrement_user_capture_count(sender, instance, **kwargs) -> None:
+    """Keep the user's denormalized capture count in step on delete."""
+    from users.profile_cache import invalidate_profile
+
+    # Failed captures gave their slot back when they failed, and captures
+    # deleted by their user keep counting against the limit
+    if instance.status == Capture.Status.FAILED or instance.keeps_capture_slot:
+        return
+
+    get_user_model().objects.filter(pk=instance.user_id, capture_count__gt=0).update(
+        capture_count=F("capture_count") - 1
+    )
+    invalidate_profile(instance.user_id)
+
+
+class Blob(models.Model):
+    """Reference-counted S3 object holding a capture artifact."""
+
+    # S3 key of the object (content-addressed keys live under blobs/sha256/)
+    file_key = models.CharField(max_length=500, unique=True)
+
+    # Metadata the object was stored with
+    content_type = models.CharField(max_length=100)
+    content_encoding = models.CharField(max_length=20, blank=True)
+
+    # Number of captures referencing the object
+    ref_count = models.PositiveIntegerField(default=0)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "capture_blobs"
+
+    def __str__(self) -> str:
+        return f"Blob {self.file_key} ({self.ref_count} refs)"
@@ -0,0 +1,153 @@
+"""
+Keyset pagination for capture lists.
+Pages are located by the (created_at, id) of the last row seen instead of an
+OFFSET, and no total count is taken, so every page costs the same as the first.
+"""
+
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CaptureCursorPagination(BasePagination):
+    """
+    Paginate captures newest first with opaque cursors.
+
+    The cursor encodes the ``created_at`` and ``id`` of the row at the edge of
+    the current page and the direction to read in, so ties on ``created_at``
+    are broken by ``id`` without skipping or repeating rows.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = False
+        if self.cursor is not None:
+            created_at, pk, reverse = self.cursor
+            if reverse:
+                queryset = queryset.filter(created_at__gte=created_at).filter(
+                    Q(created_at__gt=created_at) | Q(id__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk)
+                )
+
+        if reverse:
+            queryset = queryset.order_by("created_at", "id")
+        else:
+            queryset = queryset.order_by("-created_at", "-id")
+
+        # Fetch one extra row to learn whether there is another page
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        """Return the requested page size, capped at CAPTURE_LIST_MAX_PAGE_SIZE."""
+        default = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        try:
+            return _positive_int(
+                request.query_params.get(self.page_size_query_param, default),
+                strict=True,
+                cutoff=settings.CAPTURE_LIST_MAX_PAGE_SIZE,
+            )
+        except (TypeError, ValueError):
+            return default
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Reading backwards ran out of rows; restart from the newest
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, capture, reverse):
+        """Return the URL of the page after or before ``capture``."""
+        if isinstance(capture, dict):
+            # Rows loaded with values()
+            created_at, pk = capture["created_at"], capture["id"]
+        else:
+            created_at, pk = capture.created_at, capture.pk
+        position = {"t": created_at.isoformat(), "i": pk}
+        if reverse:
+            position["r"] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(position, separators=(",", ":")).encode("utf-8")
+        ).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """
+        Decode the cursor of the request.
+
+        Returns:
+            tuple: ``(created_at, id, reverse)``, or None on the first page
+
+        Raises:
+            NotFound: If the cursor is malformed
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            created_at = parse_datetime(position["t"])
+            pk = int(position["i"])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return created_at, pk, bool(position.get("r"))
@@ -1,64 +1,208 @@
+import time
+import uuid
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from .models import Capture
-from .utils import upload_to_s3
+from .blob_service import BlobService, blob_file_key
+from .ingest_service import IngestService
+from .utils import (
+    content_sha256,
+    decode_content,
+    get_cached_s3_url,
+    gzip_content,
+)
 from .exceptions import CaptureLimitExceededException
+from users.profile_cache import invalidate_profile
 
 
 class CaptureCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating a new capture."""
 
-    # Custom fields for file uploads
-    html = serializers.CharField(write_only=True, required=False)
-    png_screenshot = serializers.CharField(write_only=True, required=False)
+    # Custom fields for file uploads (file fields in CaptureUploadSerializer)
+    html: serializers.Field = serializers.CharField(write_only=True, required=False)
+    png_screenshot: serializers.Field = serializers.CharField(
+        write_only=True, required=False
+    )
 
     class Meta:
         model = Capture
         fields = ["website_url", "token_count", "html", "png_screenshot"]
 
     def create(self, validated_data):
+        started = time.perf_counter()
         user = self.context["request"].user
 
-        # Check if user can create a capture
-        if not user.can_create_capture():
+        # Check the limit and claim a slot in one atomic UPDATE
+        if not user.reserve_capture_slot():
             remaining = user.get_remaining_free_captures()
             raise CaptureLimitExceededException(
                 remaining_captures=remaining, total_limit=user.free_capture_limit
             )
 
-        # Extract file data
+        try:
+            capture = self._create_capture(user, validated_data, started)
+        except Exception:
+            # Give the slot back if decoding, uploading or saving failed
+            user.release_capture_slot()
+            raise
+
+        # The profile shows the capture count, which has just changed
+        invalidate_profile(user.pk)
+        return capture
+
+    def _create_capture(self, user, validated_data, started):
+        """Upload the artifacts and insert the capture for a reserved slot."""
+        # Pre-generate the slug so file keys are known before the row exists
+        slug = str(uuid.uuid4())
+        uploads = self.prepare_uploads(slug, validated_data)
+
+        self.timings = {"decode": (time.perf_counter() - started) * 1000}
+
+        if settings.CAPTURE_INGEST_MODE == "async":
+            return self._create_async(user, slug, uploads, validated_data, started)
+
+        # Upload both files to S3 concurrently, skipping content already stored
+        upload_started = time.perf_counter()
+        self.timings.update(BlobService().store_many(uploads))
+        self.timings["upload"] = (time.perf_counter() - upload_started) * 1000
+
+        # Insert the capture once, with its file keys already set
+        db_started = time.perf_counter()
+        try:
+            capture = Capture.objects.create(user=user, slug=slug, **validated_data)
+        except Exception:
+            # Drop the references store_many took for the capture
+            BlobService().release_many([upload[1] for upload in uploads.values()])
+            raise
+        self.timings["db"] = (time.perf_counter() - db_started) * 1000
+        self.timings["total"] = (time.perf_counter() - started) * 1000
+
+        return capture
+
+    def prepare_uploads(self, slug, validated_data):
+        """
+        Pop the file data from ``validated_data`` and describe the uploads.
+
+        File keys and content hashes are added to ``validated_data``.
+
+        Returns:
+            dict: Maps an upload name to a
+            ``(content, file_key, content_type, content_encoding)`` tuple
+        """
         html_content = validated_data.pop("html", None)
         png_content = validated_data.pop("png_screenshot", None)
+        uploads = {}
 
-        # Create capture instance
-        capture = Capture.objects.create(user=user, **validated_data)
-
-        # Upload files to S3 and update file keys
         if html_content:
-            capture.html_file_key = upload_to_s3(
-                html_content, f"captures/{capture.slug}/html.html", "text/html"
+            html_bytes = decode_content(html_content, "text/html")
+            html_sha256 = content_sha256(html_bytes)
+            validated_data["html_sha256"] = html_sha256
+            content_encoding = None
+            if settings.CAPTURE_HTML_COMPRESSION == "gzip":
+                # Hash the original HTML, but store it compressed
+                html_bytes = gzip_content(html_bytes)
+                content_encoding = "gzip"
+                validated_data["html_content_encoding"] = content_encoding
+            if settings.CAPTURE_DEDUPLICATE_ARTIFACTS:
+                extension = ".html.gz" if content_encoding else ".html"
+                validated_data["html_file_key"] = blob_file_key(html_sha256, extension)
+            else:
+                validated_data["html_file_key"] = f"captures/{slug}/html.html"
+            uploads["upload_html"] = (
+                html_bytes,
+                validated_data["html_file_key"],
+                "text/html",
+                content_encoding,
             )
 
         if png_content:
-            capture.png_file_key = upload_to_s3(
-                png_content, f"captures/{capture.slug}/screenshot.png", "image/png"
+            png_bytes = decode_content(png_content, "image/png")
+            png_sha256 = content_sha256(png_bytes)
+            validated_data["png_sha256"] = png_sha256
+            if settings.CAPTURE_DEDUPLICATE_ARTIFACTS:
+                validated_data["png_file_key"] = blob_file_key(png_sha256, ".png")
+            else:
+                validated_data["png_file_key"] = f"captures/{slug}/screenshot.png"
+            uploads["upload_png"] = (
+                png_bytes,
+                validated_data["png_file_key"],
+                "image/png",
+                None,
             )
 
-        capture.save()
+        return uploads
+
+    def _create_async(self, user, slug, uploads, validated_data, started):
+        """Spool the artifacts and insert a pending capture for the workers."""
+        ingest_service = IngestService()
+
+        spool_started = time.perf_counter()
+        with transaction.atomic():
+            capture = Capture.objects.create(
+                user=user,
+                slug=slug,
+                status=Capture.Status.PENDING,
+                **validated_data,
+            )
+            ingest_service.spool_capture(slug, uploads)
+            ingest_service.enqueue(slug)
+        self.timings["spool"] = (time.perf_counter() - spool_started) * 1000
+        self.timings["total"] = (time.perf_counter() - started) * 1000
+
         return capture
 
 
+class CaptureUploadSerializer(CaptureCreateSerializer):
+    """
+    Serializer for creating a capture from a multipart/form-data upload.
+
+    The HTML and PNG arrive as file parts, which Django spools to temporary
+    files, and are streamed to S3 without being loaded into memory.
+    """
+
+    html = serializers.FileField(write_only=True, required=False)
+    png_screenshot = serializers.FileField(write_only=True, required=False)
+
+
 class CaptureResponseSerializer(serializers.ModelSerializer):
     """Serializer for capture response."""
 
     class Meta:
         model = Capture
-        fields = ["slug", "website_url", "token_count", "created_at"]
-        read_only_fields = ["slug", "created_at"]
+        fields = ["slug", "website_url", "token_count", "status", "created_at"]
+        read_only_fields = ["slug", "status", "created_at"]
+
+
+class CaptureListSerializer(serializers.BaseSerializer):
+    """
+    Fast serializer for capture list rows.
+
+    Rows are dicts loaded with ``values()``, so this skips the per-field
+    machinery of a ModelSerializer and copies the requested fields straight
+    through. The fields are taken from the ``fields`` context entry.
+    """
+
+    fields = ["slug", "website_url", "token_count", "status", "created_at"]
+    created_at_field = serializers.DateTimeField()
+
+    def to_representation(self, instance):
+        data = {
+            name: instance[name] for name in self.context.get("fields", self.fields)
+        }
+        if "created_at" in data:
+            data["created_at"] = self.created_at_field.to_representation(
+                data["created_at"]
+            )
+        return data
 
 
 class CaptureDetailSerializer(serializers.ModelSerializer):
     """Serializer for detailed capture view."""
 
+    html_url = serializers.SerializerMethodField()
+    image_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Capture
         fields = [
@@ -67,6 +211,9 @@ class CaptureDetailSerializer(serializers.ModelSerializer):
             "token_count",
             "html_file_key",
             "png_file_key",
+            "html_url",
+            "image_url",
+            "status",
             "archived",
             "created_at",
             "updated_at",
@@ -75,7 +222,41 @@ class CaptureDetailSerializer(serializers.ModelSerializer):
             "slug",
             "html_file_key",
             "png_file_key",
+            "status",
             "archived",
             "created_at",
             "updated_at",
         ]
+
+    def get_html_url(self, obj):
+        """Get a short-lived presigned URL for the capture HTML."""
+        if obj.archived or obj.status != Capture.Status.READY:
+            return None
+        return get_cached_s3_url(obj.html_file_key)
+
+    def get_image_url(self, obj):
+        """Get a short-lived presigned URL for the capture screenshot."""
+        if obj.archived or obj.status != Capture.Status.READY:
+            return None
+        return get_cached_s3_url(obj.png_file_key)
+
+
+class CaptureUrlsSerializer(CaptureDetailSerializer):
+    """Serializer for the presigned content URLs of a capture."""
+
+    class Meta(CaptureDetailSerializer.Meta):
+        fields = ["slug", "html_url", "image_url"]
+
+
+class CaptureBatchSerializer(serializers.Serializer):
+    """Serializer for the slugs of a batch request."""
+
+    slugs = serializers.ListField(
+        child=serializers.CharField(max_length=36),
+        allow_empty=False,
+        max_length=settings.CAPTURE_BATCH_MAX_SIZE,
+    )
+
+    def validate_slugs(self, value):
+        """Drop repeated slugs, keeping the requested order."""
+        return list(dict.fromkeys(value))
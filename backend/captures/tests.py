@@ -1,3 +1,999 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from typing import Any
+from unittest import mock
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import F
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from . import archival_service, utils
+from .archival_service import ArchivalService
+from .blob_cache import blob_cache
+from .blob_service import BlobService
+from .html_service import ChunkWriter, HTMLChunkService, HTMLReductionService
+from .image_service import ImageVariantService
+from .ingest_service import IngestService
+from .models import Blob, Capture
+from .views import CaptureListView
+from users.models import CustomUser
 
-# Create your tests here.
+re_byte_range = re.compile(r"bytes=(\d+)-(\d*)$")
+
+
+class FakeS3:
+    """In-memory stand-in for the S3 calls made by the capture services."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def install(self, test):
+        """Replace the S3 clients' methods for the duration of ``test``."""
+        for client in (utils.s3_client, archival_service.s3_client):
+            for name in (
+                "put_object",
+                "upload_fileobj",
+                "get_object",
+                "delete_object",
+                "delete_objects",
+            ):
+                patcher = mock.patch.object(client, name, getattr(self, name))
+                patcher.start()
+                test.addCleanup(patcher.stop)
+        return self
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+        return {}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.objects[Key] = Fileobj.read()
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        data = self.objects[Key]
+        response: dict[str, Any] = {"ETag": '"s3-etag"'}
+        if Range:
+            match = re_byte_range.match(Range)
+            assert match is not None, Range
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(data) - 1), len(data) - 1)
+            if start >= len(data):
+                raise ClientError({"Error": {"Code": "InvalidRange"}}, "GetObject")
+            response["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start : end + 1]
+        response["Body"] = StreamingBody(io.BytesIO(data), len(data))
+        response["ContentLength"] = len(data)
+        return response
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        for entry in Delete["Objects"]:
+            self.objects.pop(entry["Key"], None)
+        return {}
+
+
+class CaptureIndexTests(TestCase):
+    """
+    The hot capture queries must be answered from their indexes.
+
+    The test database is built by running the migrations, so these checks
+    also catch an index that is declared on the model but never migrated.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        Capture.objects.bulk_create(
+            Capture(user=self.user, website_url="https://example.com", token_count=1)
+            for _ in range(20)
+        )
+
+        if connection.vendor == "postgresql":
+            # Tiny test tables are cheaper to scan, so make the planner show
+            # which index it would pick for a large one
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index_name, partial_index_name=None):
+        """Check the query plan names the index this database should use."""
+        if partial_index_name and connection.features.supports_partial_indexes:
+            index_name = partial_index_name
+        self.assertIn(index_name, {index.name for index in Capture._meta.indexes})
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"{index_name} not used:\n{plan}")
+
+    def test_list_query_uses_user_list_index(self):
+        request = Request(RequestFactory().get("/captures/list/"))
+        request.user = self.user
+        view = CaptureListView(request=request)
+
+        self.assertUsesIndex(
+            view.get_queryset(), "captures_user_list_idx", "captures_user_active_idx"
+        )
+
+    def test_archival_query_uses_archival_index(self):
+        queryset = ArchivalService().get_captures_to_archive(days_old=7)
+
+        self.assertUsesIndex(
+            queryset, "captures_archival_idx", "captures_active_created_idx"
+        )
+
+    def test_metrics_query_uses_created_index(self):
+        # The distinct user count of MetricsService, whose count() drops the
+        # default ordering
+        day_end = timezone.now()
+        queryset = (
+            Capture.objects.filter(
+                created_at__gte=day_end - timedelta(days=1), created_at__lt=day_end
+            )
+            .values("user")
+            .order_by()
+            .distinct()
+        )
+
+        self.assertUsesIndex(queryset, "captures_created_idx")
+
+
+class HTMLReductionTests(TestCase):
+    """Reduced HTML keeps what agents read and fits the token budget."""
+
+    page = (
+        "<!DOCTYPE html><html><head><script>track()</script>"
+        "<style>\n  body {  margin: 0 }\n</style></head>"
+        '<body>\n  <!-- nav -->\n  <div class="hero" data-id="7">Hello\n\n  world</div>'
+        "<pre>  keep\n  this</pre>"
+        + "".join(f"<p>Paragraph {i}</p>" for i in range(50))
+        + "</body></html>"
+    )
+
+    def test_reduce_strips_noise(self):
+        reduced = HTMLReductionService().reduce(self.page)
+
+        self.assertTrue(reduced.startswith("<!DOCTYPE html><html><head><style>"))
+        self.assertIn("body { margin: 0 }", reduced)
+        self.assertIn('<div class="hero">Hello world</div>', reduced)
+        self.assertIn("<pre>  keep\n  this</pre>", reduced)
+        for removed in ("track()", "<!-- nav -->", "data-id"):
+            self.assertNotIn(removed, reduced)
+
+    def test_unbalanced_tags_in_stripped_element(self):
+        reduced = HTMLReductionService().reduce(
+            "<html><body><noscript><p>Enable JS</noscript>"
+            "<main><h1>Title</h1></main><noscript></div></noscript>"
+            "<footer>End</footer></body></html>"
+        )
+
+        self.assertEqual(
+            reduced,
+            "<html><body><main><h1>Title</h1></main><footer>End</footer></body></html>",
+        )
+
+    def test_reduce_to_token_budget(self):
+        reduced = HTMLReductionService().reduce(self.page, max_tokens=100)
+
+        self.assertLessEqual(len(reduced), 100 * 4 + 50)
+        self.assertIn("<p>Paragraph 0</p>", reduced)
+        self.assertNotIn("Paragraph 49", reduced)
+        self.assertRegex(reduced, r"<!-- truncated: \d+ more element\(s\) -->")
+        self.assertTrue(reduced.endswith("</body></html>"))
+
+    def test_chunks_cover_document(self):
+        service = HTMLReductionService()
+        parser = service.parse(self.page)
+        content, chunks = ChunkWriter(max_bytes=200).write(parser)
+
+        self.assertEqual(content.decode(), service.reduce(self.page))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0]["start"], 0)
+        self.assertEqual(chunks[-1]["end"], len(content))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(previous["end"], chunk["start"])
+        for chunk in chunks:
+            self.assertLessEqual(chunk["end"] - chunk["start"], 200)
+            # Chunks are cut between elements, never inside a tag
+            self.assertTrue(content[chunk["start"] :].startswith(b"<"))
+        self.assertEqual(chunks[-1]["path"], "/html[1]/body[1]")
+
+
+class CaptureStorageTestCase(TestCase):
+    """Base for tests creating captures through the API against a fake S3."""
+
+    def setUp(self):
+        cache.clear()
+        blob_cache.clear()
+        self.s3 = FakeS3().install(self)
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        self.client.force_login(self.user)
+
+    def post_capture(self, ingest_mode="sync", **extra):
+        with override_settings(
+            CAPTURE_INGEST_MODE=ingest_mode, CAPTURE_SPOOL_DIR=self.spool_dir
+        ):
+            return self.client.post(
+                reverse("captures:capture_create"),
+                {
+                    "website_url": "https://example.com",
+                    "token_count": 1,
+                    "html": "<p>Same page</p>",
+                },
+                content_type="application/json",
+                **extra,
+            )
+
+    def create_capture(self, ingest_mode="sync"):
+        response = self.post_capture(ingest_mode)
+        return Capture.objects.get(slug=response.json()["slug"])
+
+
+class BlobReferenceTests(CaptureStorageTestCase):
+    """Only ready captures hold, and release, references to shared blobs."""
+
+    def ref_count(self, capture):
+        blob = Blob.objects.filter(file_key=capture.html_file_key).first()
+        return blob.ref_count if blob else 0
+
+    def assertHtmlServed(self, capture):
+        blob_cache.clear()
+        response = self.client.get(
+            reverse("captures:capture_html", args=[capture.slug])
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_archiving_ready_duplicates_releases_each_reference(self):
+        first, second = self.create_capture(), self.create_capture()
+        self.assertEqual(first.html_file_key, second.html_file_key)
+        self.assertEqual(self.ref_count(first), 2)
+
+        ArchivalService().archive_capture(second)
+        self.assertEqual(self.ref_count(first), 1)
+        self.assertHtmlServed(first)
+
+        ArchivalService().archive_captures([first])
+        self.assertEqual(self.ref_count(first), 0)
+        self.assertNotIn(first.html_file_key, self.s3.objects)
+
+    def test_failed_insert_releases_references(self):
+        ready = self.create_capture()
+
+        with mock.patch.object(
+            Capture.objects, "create", side_effect=DatabaseError("DB is down")
+        ):
+            with self.assertRaises(DatabaseError):
+                self.post_capture()
+
+        self.assertEqual(self.ref_count(ready), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.capture_count, 1)
+
+    def test_failed_upload_keeps_content_addressed_objects(self):
+        def put_object(Bucket, Key, Body, **kwargs):
+            if Key.endswith("broken"):
+                raise Exception("S3 is down")
+            self.s3.objects[Key] = Body
+
+        uploads = {
+            "shared": (b"shared", "blobs/sha256/ab/abc.html", "text/html", None),
+            "own": (b"own", "captures/slug/html.html", "text/html", None),
+            "broken": (b"broken", "captures/slug/broken", "text/html", None),
+        }
+        with mock.patch.object(utils.s3_client, "put_object", put_object):
+            with self.assertRaises(ValidationError):
+                utils.upload_many_to_s3(uploads)
+
+        # The shared object may already be referenced by a concurrent capture
+        self.assertIn("blobs/sha256/ab/abc.html", self.s3.objects)
+        self.assertNotIn("captures/slug/html.html", self.s3.objects)
+
+    def test_ingest_streams_spooled_files(self):
+        pending = self.create_capture(ingest_mode="async")
+
+        with mock.patch.object(
+            utils.s3_client, "put_object", side_effect=AssertionError("buffered")
+        ):
+            self.assertTrue(IngestService(self.spool_dir).process_capture(pending.slug))
+
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, Capture.Status.READY)
+        self.assertEqual(self.ref_count(pending), 1)
+        self.assertHtmlServed(pending)
+
+    def test_background_ingest_errors_are_logged(self):
+        with mock.patch.object(
+            IngestService, "process_capture", side_effect=DatabaseError("DB is down")
+        ), self.assertLogs("captures.ingest_service", "ERROR") as logs:
+            IngestService(self.spool_dir)._run("some-slug")
+
+        self.assertIn("Exception ingesting capture some-slug", logs.output[0])
+        self.assertIn("DB is down", logs.output[0])
+
+    def test_deleting_pending_duplicate_keeps_shared_blob(self):
+        ready = self.create_capture()
+        pending = self.create_capture(ingest_mode="async")
+        self.assertEqual(pending.status, Capture.Status.PENDING)
+
+        response = self.client.post(
+            reverse("captures:capture_batch_delete"),
+            {"slugs": [pending.slug]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["deleted"], [pending.slug])
+
+        # The worker finds the capture gone and takes no reference
+        self.assertFalse(IngestService(self.spool_dir).process_capture(pending.slug))
+        self.assertEqual(self.ref_count(ready), 1)
+        self.assertHtmlServed(ready)
+
+    def test_archiving_failed_duplicate_keeps_shared_blob(self):
+        ready = self.create_capture()
+        failed = self.create_capture(ingest_mode="async")
+        Capture.objects.filter(pk=failed.pk).update(status=Capture.Status.FAILED)
+        failed.refresh_from_db()
+
+        self.assertTrue(ArchivalService().archive_capture(failed))
+        self.assertEqual(self.ref_count(ready), 1)
+        self.assertHtmlServed(ready)
+
+    def test_capture_archived_during_ingest_gives_references_back(self):
+        ready = self.create_capture()
+        pending = self.create_capture(ingest_mode="async")
+        store_many = BlobService.store_many
+
+        def store_and_archive(service, uploads):
+            timings = store_many(service, uploads)
+            ArchivalService().archive_captures([Capture.objects.get(pk=pending.pk)])
+            return timings
+
+        with mock.patch.object(BlobService, "store_many", store_and_archive):
+            self.assertFalse(
+                IngestService(self.spool_dir).process_capture(pending.slug)
+            )
+
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, Capture.Status.PROCESSING)
+        self.assertEqual(self.ref_count(ready), 1)
+        self.assertHtmlServed(ready)
+
+
+class CaptureQuotaTests(CaptureStorageTestCase):
+    """Captures reserve a quota slot up front and give it back if they fail."""
+
+    def capture_count(self):
+        self.user.refresh_from_db()
+        return self.user.capture_count
+
+    def test_limit_is_enforced(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(free_capture_limit=1)
+
+        self.assertEqual(self.post_capture().status_code, 201)
+        response = self.post_capture()
+
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(response.json()["code"], "capture_limit_exceeded")
+        self.assertEqual(self.capture_count(), 1)
+        self.assertEqual(Capture.objects.count(), 1)
+
+    def test_deleting_captures_keeps_their_slots(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(free_capture_limit=1)
+        capture = self.create_capture()
+
+        response = self.client.post(
+            reverse("captures:capture_batch_delete"),
+            {"slugs": [capture.slug]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["deleted"], [capture.slug])
+
+        self.assertEqual(self.post_capture().status_code, 402)
+        self.assertEqual(self.capture_count(), 1)
+
+        # Reconciling counts the deleted capture too
+        call_command("reconcile_capture_counts", stdout=io.StringIO())
+        self.assertEqual(self.capture_count(), 1)
+
+    def test_reconcile_fixes_drifted_counts(self):
+        self.create_capture()
+        CustomUser.objects.filter(pk=self.user.pk).update(
+            capture_count=5, deleted_capture_count=1
+        )
+        other = CustomUser.objects.create_user(
+            username="other@example.com", email="other@example.com", password="x"
+        )
+
+        stdout = io.StringIO()
+        call_command("reconcile_capture_counts", stdout=stdout)
+
+        self.assertIn("for 1 user(s)", stdout.getvalue())
+        self.assertEqual(self.capture_count(), 2)
+        other.refresh_from_db()
+        self.assertEqual(other.capture_count, 0)
+
+    def test_slot_is_released_when_upload_fails(self):
+        with mock.patch.object(
+            utils.s3_client, "put_object", side_effect=Exception("S3 is down")
+        ):
+            response = self.post_capture()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.capture_count(), 0)
+        self.assertFalse(Capture.objects.exists())
+
+    @override_settings(CAPTURE_INGEST_MAX_ATTEMPTS=1)
+    def test_slot_is_released_when_ingest_fails(self):
+        capture = self.create_capture(ingest_mode="async")
+        self.assertEqual(self.capture_count(), 1)
+
+        with mock.patch.object(
+            utils.s3_client, "upload_fileobj", side_effect=Exception("S3 is down")
+        ):
+            IngestService(self.spool_dir).process_capture(capture.slug)
+
+        capture.refresh_from_db()
+        self.assertEqual(capture.status, Capture.Status.FAILED)
+        self.assertEqual(self.capture_count(), 0)
+
+        # Failed captures are left out when counting, and deleting one does
+        # not give its slot back twice
+        call_command("reconcile_capture_counts", stdout=io.StringIO())
+        self.assertEqual(self.capture_count(), 0)
+        self.create_capture()
+        capture.delete()
+        self.assertEqual(self.capture_count(), 1)
+
+
+class CaptureUploadTests(CaptureStorageTestCase):
+    """Multipart uploads are streamed to S3 without being buffered."""
+
+    html = b"<p>Uploaded page</p>"
+    png = b"\x89PNG\r\n\x1a\nnot really a PNG"
+
+    def post_upload(self, ingest_mode):
+        with override_settings(
+            CAPTURE_INGEST_MODE=ingest_mode, CAPTURE_SPOOL_DIR=self.spool_dir
+        ), mock.patch.object(
+            utils.s3_client, "put_object", side_effect=AssertionError("buffered")
+        ):
+            response = self.client.post(
+                reverse("captures:capture_upload"),
+                {
+                    "website_url": "https://example.com",
+                    "token_count": 1,
+                    "html": SimpleUploadedFile("page.html", self.html, "text/html"),
+                    "png_screenshot": SimpleUploadedFile(
+                        "shot.png", self.png, "image/png"
+                    ),
+                },
+            )
+            if response.status_code == 202:
+                IngestService(self.spool_dir).process_capture(response.json()["slug"])
+        return response
+
+    def assertStored(self, response):
+        capture = Capture.objects.get(slug=response.json()["slug"])
+        self.assertEqual(capture.status, Capture.Status.READY)
+        self.assertEqual(
+            gzip.decompress(self.s3.objects[capture.html_file_key]), self.html
+        )
+        self.assertEqual(self.s3.objects[capture.png_file_key], self.png)
+
+    def test_sync_upload(self):
+        response = self.post_upload("sync")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertStored(response)
+
+    def test_async_upload(self):
+        response = self.post_upload("async")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertStored(response)
+
+
+class CaptureRequestSizeTests(CaptureStorageTestCase):
+    """Oversized and over-quota captures are rejected before the body is read."""
+
+    def setUp(self):
+        super().setUp()
+        parse = mock.patch.object(
+            JSONParser, "parse", side_effect=AssertionError("body parsed")
+        )
+        self.parse = parse.start()
+        self.addCleanup(parse.stop)
+
+    def test_missing_content_length(self):
+        response = self.post_capture(CONTENT_LENGTH="")
+
+        self.assertEqual(response.status_code, 411)
+        self.parse.assert_not_called()
+
+    @override_settings(CAPTURE_MAX_REQUEST_BYTES=10)
+    def test_body_over_limit(self):
+        response = self.post_capture()
+
+        self.assertEqual(response.status_code, 413)
+        self.parse.assert_not_called()
+
+    def test_over_quota(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(
+            capture_count=F("free_capture_limit")
+        )
+
+        response = self.post_capture()
+
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(response.json()["code"], "capture_limit_exceeded")
+        self.parse.assert_not_called()
+
+
+class ImageVariantTests(TestCase):
+    """Variants are recorded by concurrent requests and deleted on archival."""
+
+    def setUp(self):
+        self.service = ImageVariantService()
+        if not self.service.is_available():
+            self.skipTest("Pillow is not installed")
+
+        from PIL import Image
+
+        blob_cache.clear()
+        self.s3 = FakeS3().install(self)
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        png = io.BytesIO()
+        Image.new("RGB", (64, 32), "red").save(png, "PNG")
+        self.s3.objects["captures/shot.png"] = png.getvalue()
+        self.capture = Capture.objects.create(
+            user=self.user,
+            website_url="https://example.com",
+            token_count=1,
+            png_file_key="captures/shot.png",
+        )
+
+    def test_concurrent_variants_are_merged(self):
+        # Two requests that loaded the capture before either variant existed
+        first = Capture.objects.get(pk=self.capture.pk)
+        second = Capture.objects.get(pk=self.capture.pk)
+        self.service.get_variant(first, "thumb", "png")
+        self.service.get_variant(second, "mcp", "png")
+
+        self.capture.refresh_from_db()
+        self.assertEqual(set(self.capture.image_variants), {"thumb.png", "mcp.png"})
+        self.assertEqual(second.image_variants, self.capture.image_variants)
+
+    def test_archival_deletes_variants_recorded_meanwhile(self):
+        stale = Capture.objects.get(pk=self.capture.pk)
+        file_key = self.service.get_variant(self.capture, "thumb", "png")
+
+        self.assertTrue(ArchivalService().archive_capture(stale))
+
+        self.assertNotIn(file_key, self.s3.objects)
+
+    def test_variant_of_capture_archived_meanwhile_is_deleted(self):
+        record_variant = ImageVariantService.record_variant
+
+        def archive_and_record(service, capture, name, file_key):
+            ArchivalService().archive_captures([Capture.objects.get(pk=capture.pk)])
+            return record_variant(service, capture, name, file_key)
+
+        with mock.patch.object(
+            ImageVariantService, "record_variant", archive_and_record
+        ):
+            with self.assertRaises(ValueError):
+                self.service.get_variant(self.capture, "thumb", "png")
+
+        self.assertEqual(self.s3.objects, {})
+        self.capture.refresh_from_db()
+        self.assertEqual(self.capture.image_variants, {})
+
+
+class HTMLChunkIndexTests(CaptureStorageTestCase):
+    """Chunk files are recorded on the capture so archival deletes them."""
+
+    def test_index_replaces_older_version(self):
+        capture = self.create_capture()
+        old_file_key = f"captures/{capture.slug}/html-reduced-v0.html"
+        self.s3.objects[old_file_key] = b"<p>Same page</p>"
+        Capture.objects.filter(pk=capture.pk).update(
+            html_chunks={"version": 0, "file_key": old_file_key, "chunks": []}
+        )
+        capture.refresh_from_db()
+
+        chunks = HTMLChunkService().generate_chunk_index(capture)
+
+        capture.refresh_from_db()
+        self.assertEqual(capture.html_chunks["chunks"], chunks)
+        self.assertIn(capture.html_chunks["file_key"], self.s3.objects)
+        self.assertNotIn(old_file_key, self.s3.objects)
+
+    def test_index_of_capture_archived_meanwhile_is_deleted(self):
+        capture = self.create_capture()
+        record_chunk_index = HTMLChunkService.record_chunk_index
+
+        def archive_and_record(service, capture, html_chunks):
+            ArchivalService().archive_captures([Capture.objects.get(pk=capture.pk)])
+            return record_chunk_index(service, capture, html_chunks)
+
+        with mock.patch.object(
+            HTMLChunkService, "record_chunk_index", archive_and_record
+        ):
+            with self.assertRaises(ValueError):
+                HTMLChunkService().generate_chunk_index(capture)
+
+        self.assertEqual(self.s3.objects, {})
+        capture.refresh_from_db()
+        self.assertEqual(capture.html_chunks, {})
+
+
+class CaptureBatchTests(CaptureStorageTestCase):
+    """Batch endpoints only act on the requesting user's captures."""
+
+    def setUp(self):
+        super().setUp()
+        self.other_user = CustomUser.objects.create_user(
+            username="other@example.com", email="other@example.com", password="x"
+        )
+        self.captures = [self.create_capture() for _ in range(2)]
+        self.other_capture = Capture.objects.create(
+            user=self.other_user, website_url="https://example.com", token_count=1
+        )
+        self.other_capture.refresh_from_db()
+
+    def post_batch(self, name, slugs):
+        return self.client.post(
+            reverse(name), {"slugs": slugs}, content_type="application/json"
+        )
+
+    def test_fetch_reports_missing_and_other_users_slugs(self):
+        slugs = [self.captures[1].slug, self.other_capture.slug, "unknown"]
+        slugs.append(self.captures[0].slug)
+
+        response = self.post_batch("captures:capture_batch", slugs)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["slug"] for result in response.json()["results"]],
+            [self.captures[1].slug, self.captures[0].slug],
+        )
+        self.assertEqual(
+            response.json()["missing"], [self.other_capture.slug, "unknown"]
+        )
+
+    def test_archive_and_delete_skip_other_users_captures(self):
+        slugs = [self.captures[0].slug, self.other_capture.slug]
+
+        response = self.post_batch("captures:capture_batch_archive", slugs)
+        self.assertEqual(response.json()["archived"], [self.captures[0].slug])
+        self.assertEqual(response.json()["missing"], [self.other_capture.slug])
+
+        response = self.post_batch("captures:capture_batch_delete", slugs)
+        self.assertEqual(response.json()["deleted"], [self.captures[0].slug])
+
+        self.assertFalse(Capture.objects.filter(pk=self.captures[0].pk).exists())
+        self.other_capture.refresh_from_db()
+        self.assertFalse(self.other_capture.archived)
+
+    def test_batch_size_is_capped(self):
+        slugs = [f"slug-{i}" for i in range(settings.CAPTURE_BATCH_MAX_SIZE + 1)]
+
+        response = self.post_batch("captures:capture_batch", slugs)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("slugs", response.json())
+
+
+class CaptureContentTests(CaptureStorageTestCase):
+    """Content endpoints honour validators, ranges and content encodings."""
+
+    html = b"<p>Same page</p>"
+    png = b"\x89PNG not really an image"
+
+    def setUp(self):
+        super().setUp()
+        self.capture = self.create_capture()
+        self.s3.objects["captures/shot.png"] = self.png
+        Capture.objects.filter(pk=self.capture.pk).update(
+            png_file_key="captures/shot.png", png_sha256="a" * 64
+        )
+        blob_cache.clear()
+
+    def get_content(self, name, **headers):
+        return self.client.get(reverse(name, args=[self.capture.slug]), **headers)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get_content("captures:capture_image")["ETag"]
+
+        response = self.get_content("captures:capture_image", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_range_request_returns_partial_content(self):
+        response = self.get_content("captures:capture_image", HTTP_RANGE="bytes=0-3")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 0-3/{len(self.png)}")
+        self.assertEqual(b"".join(response.streaming_content), self.png[:4])
+
+    def test_stale_if_range_returns_full_content(self):
+        response = self.get_content(
+            "captures:capture_image",
+            HTTP_RANGE="bytes=0-3",
+            HTTP_IF_RANGE='"stale"',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Range"))
+        self.assertEqual(response.content, self.png)
+
+    def test_unsatisfiable_range(self):
+        response = self.get_content(
+            "captures:capture_image", HTTP_RANGE=f"bytes={len(self.png)}-"
+        )
+
+        self.assertEqual(response.status_code, 416)
+
+    def test_gzip_html_is_passed_through(self):
+        response = self.get_content(
+            "captures:capture_html", HTTP_ACCEPT_ENCODING="gzip, br"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.html)
+        self.assertTrue(response["ETag"].endswith('-gzip"'))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzip_html_is_decoded_for_other_clients(self):
+        response = self.get_content("captures:capture_html")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.html)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzip_refused_with_zero_quality(self):
+        response = self.get_content(
+            "captures:capture_html", HTTP_ACCEPT_ENCODING="br, gzip;q=0"
+        )
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.html)
+
+        factory = RequestFactory()
+        for header, accepted in [
+            ("gzip", True),
+            ("deflate, GZIP ; q=0.5", True),
+            ("*", True),
+            ("gzip;q=0, *", False),
+            ("identity, *;q=0", False),
+            ("gzip;q=0.0", False),
+            ("gzip;q=x", False),
+            ("x-gzip-like", False),
+        ]:
+            request = factory.get("/", HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(utils.accepts_gzip(request), accepted, header)
+
+    def test_delivery_modes(self):
+        # Objects too large for the blob cache are streamed or buffered
+        with mock.patch.object(blob_cache, "max_item_bytes", 0):
+            with override_settings(CAPTURE_CONTENT_DELIVERY="stream"):
+                response = self.get_content("captures:capture_image")
+            self.assertTrue(response.streaming)
+            self.assertEqual(response["Content-Length"], str(len(self.png)))
+            self.assertEqual(b"".join(response.streaming_content), self.png)
+
+            with override_settings(CAPTURE_CONTENT_DELIVERY="buffer"):
+                response = self.get_content("captures:capture_image")
+            self.assertFalse(response.streaming)
+            self.assertEqual(response.content, self.png)
+
+            # Streamed gzip HTML is decompressed on the fly
+            response = self.get_content("captures:capture_html")
+            self.assertTrue(response.streaming)
+            self.assertEqual(b"".join(response.streaming_content), self.html)
+
+    def presign(self):
+        """Patch presigning to return a distinct URL on every call."""
+        urls = (f"https://s3.example.com/{i}" for i in range(100))
+        return mock.patch.object(
+            utils.s3_client,
+            "generate_presigned_url",
+            side_effect=lambda method, Params, ExpiresIn: f"{next(urls)}/{Params['Key']}",
+        )
+
+    @override_settings(CAPTURE_CONTENT_DELIVERY="redirect")
+    def test_redirect_delivery(self):
+        with self.presign() as presign:
+            image = self.get_content("captures:capture_image")
+            html = self.get_content(
+                "captures:capture_html", HTTP_ACCEPT_ENCODING="gzip"
+            )
+            again = self.get_content("captures:capture_image")
+
+        self.assertEqual(image.status_code, 302)
+        self.assertTrue(image["Location"].endswith("/captures/shot.png"))
+        self.assertEqual(html.status_code, 302)
+        self.assertTrue(html["Location"].endswith(self.capture.html_file_key))
+        # Cached URLs are reused until shortly before they expire
+        self.assertEqual(again["Location"], image["Location"])
+        self.assertEqual(presign.call_count, 2)
+
+    @override_settings(CAPTURE_CONTENT_DELIVERY="redirect")
+    def test_gzip_html_is_not_redirected_to_other_clients(self):
+        with self.presign() as presign:
+            response = self.get_content(
+                "captures:capture_html", HTTP_ACCEPT_ENCODING="identity"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.html)
+        presign.assert_not_called()
+
+    def test_detail_urls(self):
+        url = reverse("captures:capture_detail", args=[self.capture.slug])
+        with self.presign() as presign:
+            first = self.client.get(url).json()
+            second = self.client.get(url).json()
+
+        self.assertTrue(first["html_url"].endswith(self.capture.html_file_key))
+        self.assertTrue(first["image_url"].endswith("/captures/shot.png"))
+        self.assertEqual(
+            (second["html_url"], second["image_url"]),
+            (first["html_url"], first["image_url"]),
+        )
+        self.assertEqual(presign.call_count, 2)
+
+    def test_detail_urls_of_pending_capture(self):
+        Capture.objects.filter(pk=self.capture.pk).update(status=Capture.Status.PENDING)
+
+        with self.presign() as presign:
+            response = self.client.get(
+                reverse("captures:capture_detail", args=[self.capture.slug])
+            )
+
+        self.assertIsNone(response.json()["html_url"])
+        self.assertIsNone(response.json()["image_url"])
+        presign.assert_not_called()
+
+
+class CaptureCursorPaginationTests(TestCase):
+    """Keyset pages neither skip nor repeat rows, in either direction."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        self.client.force_login(self.user)
+
+        # Three captures share a timestamp, so their order rests on the id
+        now = timezone.now()
+        offsets = [0, 1, 1, 1, 2, 3, 4]
+        for offset in offsets:
+            capture = Capture.objects.create(
+                user=self.user, website_url="https://example.com", token_count=1
+            )
+            Capture.objects.filter(pk=capture.pk).update(
+                created_at=now - timedelta(minutes=offset)
+            )
+        self.expected = list(
+            Capture.objects.order_by("-created_at", "-id").values_list(
+                "slug", flat=True
+            )
+        )
+
+    def get_page(self, url=None, **params):
+        response = self.client.get(
+            url or reverse("captures:capture_list"),
+            None if url else {"pagination": "cursor", **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_forward_and_backward_traversal(self):
+        page = self.get_page(page_size=2)
+        self.assertIsNone(page["previous"])
+        pages = [page]
+        while page["next"]:
+            page = self.get_page(page["next"])
+            pages.append(page)
+
+        slugs = [row["slug"] for page in pages for row in page["results"]]
+        self.assertEqual(slugs, self.expected)
+
+        # Walk back from the last page to the first
+        backward = []
+        while page["previous"]:
+            page = self.get_page(page["previous"])
+            backward = [row["slug"] for row in page["results"]] + backward
+        self.assertEqual(backward, self.expected[: len(backward)])
+        self.assertEqual(len(backward), len(self.expected) - len(pages[-1]["results"]))
+
+    def test_malformed_cursor_is_not_found(self):
+        bad_time = base64.urlsafe_b64encode(b'{"t": "yesterday", "i": 1}').decode()
+        for cursor in ("not base64!", "e30=", bad_time):
+            response = self.client.get(
+                reverse("captures:capture_list"),
+                {"pagination": "cursor", "cursor": cursor},
+            )
+            self.assertEqual(response.status_code, 404, cursor)
+
+    @override_settings(CAPTURE_LIST_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        page = self.get_page(page_size=50)
+
+        self.assertEqual(len(page["results"]), 3)
+        self.assertIsNotNone(page["next"])
+
+
+class CaptureListFieldsTests(TestCase):
+    """The capture list returns only the fields asked for with ?fields=."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        self.client.force_login(self.user)
+        self.capture = Capture.objects.create(
+            user=self.user, website_url="https://example.com", token_count=3
+        )
+        self.capture.refresh_from_db()
+
+    def get_list(self, **params):
+        return self.client.get(reverse("captures:capture_list"), params)
+
+    def test_default_fields(self):
+        response = self.get_list()
+
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()["results"]
+        self.assertEqual(
+            set(row), {"slug", "website_url", "token_count", "status", "created_at"}
+        )
+        self.assertEqual(row["slug"], self.capture.slug)
+        self.assertEqual(row["token_count"], 3)
+
+    def test_requested_fields(self):
+        response = self.get_list(fields="slug, created_at")
+
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()["results"]
+        self.assertEqual(list(row), ["slug", "created_at"])
+        self.assertEqual(row["slug"], self.capture.slug)
+
+    def test_unknown_field(self):
+        for fields in ("slug,html_file_key", ","):
+            response = self.get_list(fields=fields)
+
+            self.assertEqual(response.status_code, 400, fields)
+            self.assertIn("fields", response.json())
+
+    def test_requested_fields_with_cursor_pagination(self):
+        response = self.get_list(fields="slug", pagination="cursor")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [{"slug": self.capture.slug}])
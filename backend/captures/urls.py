@@ -6,8 +6,35 @@ app_name = "captures"
 urlpatterns = [
     # Create a new capture
     path("create/", views.CaptureCreateView.as_view(), name="capture_create"),
+    # Create a new capture from a multipart/form-data upload
+    path("create/upload/", views.CaptureUploadView.as_view(), name="capture_upload"),
     # List all captures for the user
     path("list/", views.CaptureListView.as_view(), name="capture_list"),
+    # Batch operations on several of the user's captures
+    path(
+        "batch/",
+        views.CaptureBatchView.as_view(),
+        {"action": "fetch"},
+        name="capture_batch",
+    ),
+    path(
+        "batch/urls/",
+        views.CaptureBatchView.as_view(),
+        {"action": "urls"},
+        name="capture_batch_urls",
+    ),
+    path(
+        "batch/archive/",
+        views.CaptureBatchView.as_view(),
+        {"action": "archive"},
+        name="capture_batch_archive",
+    ),
+    path(
+        "batch/delete/",
+        views.CaptureBatchView.as_view(),
+        {"action": "delete"},
+        name="capture_batch_delete",
+    ),
     # Get capture details by slug
     path("<str:slug>/", views.CaptureDetailView.as_view(), name="capture_detail"),
     # Custom actions for serving HTML and image content
@@ -1,20 +1,167 @@
 import os
+import time
 import boto3
 import base64
+import gzip
+import hashlib
+import logging
+import re
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework import serializers
+from .blob_cache import blob_cache
+
+logger = logging.getLogger(__name__)
+
+re_quality = re.compile(r"\bq\s*=\s*([^\s;]*)", re.IGNORECASE)
 
 s3_client = boto3.client("s3")
 
+# Prefix of content-addressed objects, which captures of the same content share
+BLOB_KEY_PREFIX = "blobs/sha256/"
+
+# Bounded pool shared by all requests in this process for artifact uploads
+upload_executor = ThreadPoolExecutor(
+    max_workers=settings.CAPTURE_UPLOAD_WORKERS, thread_name_prefix="capture-upload"
+)
+
+# Large file uploads are sent to S3 as multipart uploads
+transfer_config = TransferConfig(
+    multipart_threshold=settings.CAPTURE_MULTIPART_THRESHOLD,
+    multipart_chunksize=settings.CAPTURE_MULTIPART_CHUNK_SIZE,
+)
+
+
+def decode_content(content, content_type):
+    """
+    Convert capture content received from the client into raw bytes.
+
+    Uploaded files are returned unchanged so they can be streamed to S3.
+
+    Args:
+        content: The content to convert (string, bytes or uploaded file)
+        content_type: The MIME type of the content
+
+    Returns:
+        bytes: The raw content, or the file object itself
+
+    Raises:
+        serializers.ValidationError: If base64 PNG data is invalid
+    """
+    if isinstance(content, bytes) or hasattr(content, "read"):
+        return content
+
+    # Handle base64 encoded content for PNG
+    if content_type == "image/png":
+        try:
+            return base64.b64decode(content)
+        except Exception:
+            raise serializers.ValidationError("Invalid base64 encoded PNG data")
+
+    return content.encode("utf-8")
+
 
-def upload_to_s3(content, file_key, content_type):
+def content_sha256(content):
+    """Return the hex SHA-256 digest of raw capture content or a file."""
+    if not hasattr(content, "read"):
+        return hashlib.sha256(content).hexdigest()
+
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(settings.CAPTURE_STREAM_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def gzip_content(content):
+    """
+    Gzip-compress capture content for storage.
+
+    Files are compressed chunk by chunk into a spooled temporary file so
+    large uploads are never held in memory as a whole.
+
+    Args:
+        content: Raw bytes or a file object
+
+    Returns:
+        The compressed bytes, or a file object positioned at its start
+    """
+    if not hasattr(content, "read"):
+        return gzip.compress(content, mtime=0)
+
+    compressed = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    content.seek(0)
+    with gzip.GzipFile(fileobj=compressed, mode="wb", mtime=0) as f:
+        shutil.copyfileobj(content, f, settings.CAPTURE_STREAM_CHUNK_SIZE)
+    compressed.seek(0)
+    return compressed
+
+
+def iter_gunzip(chunks):
+    """
+    Decompress a gzip stream incrementally.
+
+    Args:
+        chunks: Iterable of compressed byte chunks
+
+    Yields:
+        bytes: Decompressed chunks
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def decode_stored_content(data, content_encoding):
+    """Undo the storage encoding of capture content read from S3."""
+    if content_encoding == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+def accepts_gzip(request):
+    """
+    Check whether the client accepts gzip-encoded responses.
+
+    The Accept-Encoding entry for gzip, or failing that for "*", must have a
+    non-zero quality value, so "gzip;q=0" refuses gzip.
+    """
+    qualities = {}
+    for entry in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = entry.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        match = re_quality.search(params)
+        try:
+            qualities[coding] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            qualities[coding] = 0.0
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def upload_to_s3(content, file_key, content_type, content_encoding=None):
     """
     Upload content to S3 and return the file key.
 
     Args:
-        content: The content to upload (string or bytes)
+        content: The content to upload (string, bytes or file object)
         file_key: The S3 key for the file
         content_type: The MIME type of the content
+        content_encoding: Storage encoding of the content (e.g. "gzip")
 
     Returns:
         str: The file key if successful
@@ -23,30 +170,174 @@ def upload_to_s3(content, file_key, content_type):
         serializers.ValidationError: If upload fails
     """
     try:
-        # Handle base64 encoded content for PNG
-        if content_type == "image/png" and isinstance(content, str):
-            try:
-                content = base64.b64decode(content)
-            except Exception:
-                raise serializers.ValidationError("Invalid base64 encoded PNG data")
+        content = decode_content(content, content_type)
+        extra_args = {"ContentType": content_type}
+        if content_encoding:
+            extra_args["ContentEncoding"] = content_encoding
+
+        if hasattr(content, "read"):
+            # Stream files to S3, switching to a multipart upload when large
+            content.seek(0)
+            s3_client.upload_fileobj(
+                content,
+                settings.AWS_STORAGE_BUCKET_NAME,
+                file_key,
+                ExtraArgs=extra_args,
+                Config=transfer_config,
+            )
+            return file_key
 
         s3_client.put_object(
             Bucket=settings.AWS_STORAGE_BUCKET_NAME,
             Key=file_key,
             Body=content,
-            ContentType=content_type,
+            **extra_args,
         )
         return file_key
     except Exception as e:
         raise serializers.ValidationError(f"Failed to upload to S3: {str(e)}")
 
 
-def get_s3_url(file_key):
+def _timed_upload(content, file_key, content_type, content_encoding):
+    start = time.perf_counter()
+    upload_to_s3(content, file_key, content_type, content_encoding)
+    return (time.perf_counter() - start) * 1000
+
+
+def upload_many_to_s3(uploads):
+    """
+    Upload several files to S3 concurrently on the shared upload pool.
+
+    If any upload fails, the ones that succeeded are deleted again so no
+    orphaned objects are left behind. Content-addressed objects are kept, as
+    a concurrent capture of the same content may already reference them.
+
+    Args:
+        uploads (dict): Maps a name to a
+            ``(content, file_key, content_type, content_encoding)`` tuple
+
+    Returns:
+        dict: Upload duration in milliseconds for each name
+
+    Raises:
+        serializers.ValidationError: If any upload fails
+    """
+    futures = {
+        name: upload_executor.submit(_timed_upload, *upload)
+        for name, upload in uploads.items()
+    }
+
+    timings = {}
+    error = None
+    for name, future in futures.items():
+        try:
+            timings[name] = future.result()
+        except Exception as e:
+            error = error or e
+
+    if error is not None:
+        for name in timings:
+            file_key = uploads[name][1]
+            if file_key.startswith(BLOB_KEY_PREFIX):
+                continue
+            try:
+                s3_client.delete_object(
+                    Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key
+                )
+            except Exception as e:
+                logger.error(f"Failed to clean up S3 file {file_key}: {str(e)}")
+        raise error
+
+    return timings
+
+
+def format_server_timing(timings):
+    """
+    Format millisecond timings as a ``Server-Timing`` header value.
+
+    Args:
+        timings (dict): Maps a metric name to a duration in milliseconds
+
+    Returns:
+        str: The header value
+    """
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+
+def get_s3_object(file_key, byte_range=None):
+    """
+    Fetch an object from S3 without reading its body.
+
+    Args:
+        file_key: The S3 key of the file
+        byte_range: Optional HTTP ``Range`` header value to forward to S3
+
+    Returns:
+        dict: The boto3 get_object response; ``Body`` is a streaming body
+    """
+    params = {"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": file_key}
+    if byte_range:
+        params["Range"] = byte_range
+    return s3_client.get_object(**params)
+
+
+def iter_s3_body(body, chunk_size=None):
+    """
+    Iterate over a botocore StreamingBody, closing it when exhausted.
+
+    Args:
+        body: The ``Body`` of a get_object response
+        chunk_size: Number of bytes per chunk
+
+    Yields:
+        bytes: Successive chunks of the object
+    """
+    chunk_size = chunk_size or settings.CAPTURE_STREAM_CHUNK_SIZE
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+
+def get_s3_bytes(file_key):
+    """
+    Get the full content of an S3 object, served from the blob cache when
+    possible.
+
+    Args:
+        file_key: The S3 key of the file
+
+    Returns:
+        bytes: The object content
+    """
+    data = blob_cache.get(file_key)
+    if data is None:
+        data = get_s3_object(file_key)["Body"].read()
+        blob_cache.set(file_key, data)
+    return data
+
+
+def get_capture_html(capture):
+    """
+    Get the decoded HTML of a capture, decompressing it once if needed.
+
+    Args:
+        capture (Capture): The capture to read
+
+    Returns:
+        str: The HTML content
+    """
+    data = get_s3_bytes(capture.html_file_key)
+    return decode_stored_content(data, capture.html_content_encoding).decode("utf-8")
+
+
+def get_s3_url(file_key, expires_in=3600):
     """
     Generate a presigned URL for accessing a file in S3.
 
     Args:
         file_key: The S3 key of the file
+        expires_in: Lifetime of the URL in seconds (defaults to 1 hour)
 
     Returns:
         str: Presigned URL for the file
@@ -56,8 +347,38 @@ def get_s3_url(file_key):
         url = s3_client.generate_presigned_url(
             "get_object",
             Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": file_key},
-            ExpiresIn=3600,  # URL expires in 1 hour
+            ExpiresIn=expires_in,
         )
         return url
     except Exception as e:
         return None
+
+
+def get_cached_s3_url(file_key):
+    """
+    Get a short-lived presigned URL for a capture file, reusing a cached one
+    until shortly before it expires.
+
+    Args:
+        file_key: The S3 key of the file
+
+    Returns:
+        str: Presigned URL for the file, or None if it could not be generated
+    """
+    if not file_key:
+        return None
+
+    cache_key = f"capture-url:{file_key}"
+    url = cache.get(cache_key)
+    if url is None:
+        expires_in = settings.CAPTURE_PRESIGNED_URL_EXPIRY
+        url = get_s3_url(file_key, expires_in=expires_in)
+        if url:
+            cache.set(
+                cache_key,
+                url,
+                timeout=max(
+                    expires_in - settings.CAPTURE_PRESIGNED_URL_REFRESH_MARGIN, 0
+                ),
+            )
+    return url
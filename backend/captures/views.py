@@ -1,24 +1,52 @@
+from typing import Any
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from rest_framework import status
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, RetrieveAPIView
-from django.http import HttpResponse
-import boto3
-from core import settings
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import quote_etag
+from botocore.exceptions import ClientError
 
 from .models import Capture
 from .serializers import (
     CaptureCreateSerializer,
+    CaptureUploadSerializer,
     CaptureResponseSerializer,
     CaptureDetailSerializer,
+    CaptureListSerializer,
+    CaptureBatchSerializer,
+    CaptureUrlsSerializer,
+)
+from .exceptions import (
+    CaptureLengthRequiredException,
+    CaptureLimitExceededException,
+    CaptureTooLargeException,
+)
+from .archival_service import ArchivalService
+from .image_service import ImageVariantService
+from .pagination import CaptureCursorPagination
+from .blob_cache import blob_cache
+from .utils import (
+    accepts_gzip,
+    decode_stored_content,
+    format_server_timing,
+    get_cached_s3_url,
+    get_s3_object,
+    iter_gunzip,
+    iter_s3_body,
 )
-from .exceptions import CaptureLimitExceededException
-
-# Initialize S3 client
-s3_client = boto3.client("s3")
 
 
 @method_decorator(csrf_exempt, name="dispatch")
@@ -26,10 +54,21 @@ class CaptureCreateView(APIView):
     """API view for creating a new capture."""
 
     permission_classes = [IsAuthenticated]
+    serializer_class = CaptureCreateSerializer
 
     def post(self, request):
         """Create a new capture with HTML and PNG data."""
-        serializer = CaptureCreateSerializer(
+        # Reject what we can before the body is read, as DRF only parses it
+        # once request.data is accessed
+        self.check_request_size(request)
+        if not request.user.can_create_capture():
+            return self.capture_limit_response(
+                CaptureLimitExceededException(
+                    remaining_captures=0, total_limit=request.user.free_capture_limit
+                )
+            )
+
+        serializer = self.serializer_class(
             data=request.data, context={"request": request}
         )
 
@@ -38,31 +77,142 @@ class CaptureCreateView(APIView):
                 capture = serializer.save()
                 response_serializer = CaptureResponseSerializer(capture)
                 return Response(
-                    response_serializer.data, status=status.HTTP_201_CREATED
+                    response_serializer.data,
+                    # Asynchronously ingested captures are still being uploaded
+                    status=(
+                        status.HTTP_202_ACCEPTED
+                        if capture.status == Capture.Status.PENDING
+                        else status.HTTP_201_CREATED
+                    ),
+                    headers={"Server-Timing": format_server_timing(serializer.timings)},
                 )
             except CaptureLimitExceededException as e:
-                return Response(
-                    {
-                        "error": str(e),
-                        "code": "capture_limit_exceeded",
-                        "remaining_captures": e.remaining_captures,
-                        "upgrade_required": True,
-                    },
-                    status=e.status_code,
-                )
+                return self.capture_limit_response(e)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def check_request_size(self, request):
+        """
+        Enforce CAPTURE_MAX_REQUEST_BYTES using the Content-Length header.
+
+        Raises:
+            CaptureLengthRequiredException: If the size is not declared
+            CaptureTooLargeException: If the body is over the limit
+        """
+        content_length = request.META.get("CONTENT_LENGTH")
+        if not content_length:
+            raise CaptureLengthRequiredException()
+
+        try:
+            size = int(content_length)
+        except ValueError:
+            raise ParseError("Invalid Content-Length header.")
+
+        if size > settings.CAPTURE_MAX_REQUEST_BYTES:
+            raise CaptureTooLargeException(max_bytes=settings.CAPTURE_MAX_REQUEST_BYTES)
+
+    def capture_limit_response(self, e):
+        """Build the response for a user who has no captures left."""
+        return Response(
+            {
+                "error": str(e),
+                "code": "capture_limit_exceeded",
+                "remaining_captures": e.remaining_captures,
+                "upgrade_required": True,
+            },
+            status=e.status_code,
+        )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class CaptureUploadView(CaptureCreateView):
+    """API view for creating a capture from a multipart/form-data upload."""
+
+    parser_classes = [MultiPartParser]
+    serializer_class = CaptureUploadSerializer
+
 
 class CaptureListView(ListAPIView):
     """API view for listing user's captures."""
 
     permission_classes = [IsAuthenticated]
-    serializer_class = CaptureResponseSerializer
+    serializer_class = CaptureListSerializer
+
+    def get_list_fields(self):
+        """
+        Get the fields requested with ``?fields=``, e.g. ``slug,created_at``.
+
+        Raises:
+            ValidationError: If an unknown field is requested
+        """
+        requested = self.request.query_params.get("fields")
+        if not requested:
+            return CaptureListSerializer.fields
+
+        fields = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = [name for name in fields if name not in CaptureListSerializer.fields]
+        if unknown or not fields:
+            allowed = ", ".join(CaptureListSerializer.fields)
+            raise ValidationError({"fields": f"Choose fields from: {allowed}"})
+        return fields
 
     def get_queryset(self):
         """Return captures for the authenticated user, excluding archived ones."""
-        return Capture.objects.filter(user=self.request.user, archived=False)
+        # Load only the listed columns; id and created_at position the cursor
+        columns = {"id", "created_at", *self.get_list_fields()}
+        return Capture.objects.filter(user=self.request.user, archived=False).values(
+            *columns
+        )
+
+    def get_serializer_context(self):
+        context = dict(super().get_serializer_context())
+        context["fields"] = self.get_list_fields()
+        return context
+
+    @property
+    def paginator(self):
+        """Use keyset pagination when the client asks for ?pagination=cursor."""
+        if not hasattr(self, "_paginator"):
+            if self.request.query_params.get("pagination") == "cursor":
+                self._paginator = CaptureCursorPagination()
+        return super().paginator
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class CaptureBatchView(APIView):
+    """API view for fetching, archiving or deleting several captures at once."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, action=None):
+        """Run ``action`` on the user's captures listed in ``slugs``."""
+        serializer = CaptureBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Slugs of other users' captures are reported as missing
+        slugs = serializer.validated_data["slugs"]
+        found = {
+            capture.slug: capture
+            for capture in Capture.objects.filter(user=request.user, slug__in=slugs)
+        }
+        captures = [found[slug] for slug in slugs if slug in found]
+        missing = [slug for slug in slugs if slug not in found]
+
+        data: dict[str, Any]
+        if action == "archive":
+            ArchivalService().archive_captures(captures)
+            data = {"archived": [capture.slug for capture in captures]}
+        elif action == "delete":
+            ArchivalService().delete_captures(captures)
+            data = {"deleted": [capture.slug for capture in captures]}
+        elif action == "urls":
+            data = {"results": CaptureUrlsSerializer(captures, many=True).data}
+        else:
+            data = {"results": CaptureDetailSerializer(captures, many=True).data}
+
+        data["missing"] = missing
+        return Response(data)
 
 
 class CaptureDetailView(RetrieveAPIView):
@@ -96,6 +246,147 @@ class CaptureDetailView(RetrieveAPIView):
             return self.serve_image(request, kwargs.get("slug"))
         return super().dispatch(request, *args, **kwargs)
 
+    def not_ready_response(self, capture):
+        """Explain why the content of a capture that is not ready is missing."""
+        if capture.status == Capture.Status.FAILED:
+            return HttpResponse(
+                "Capture upload failed", status=410, content_type="text/plain"
+            )
+        response = HttpResponse(
+            "Capture is still being processed", status=409, content_type="text/plain"
+        )
+        response["Retry-After"] = "1"
+        return response
+
+    def not_modified_response(self, request, etag):
+        """
+        Return a 304 response if the client already holds ``etag``.
+
+        Captures never change after creation, so this check is answered from
+        the database row alone without touching S3.
+        """
+        if not etag:
+            return None
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response["ETag"] = etag
+            self.add_cache_headers(response)
+        return response
+
+    def add_cache_headers(self, response):
+        """Mark capture content as immutable for as long as it is kept."""
+        patch_cache_control(
+            response,
+            private=True,
+            max_age=settings.CAPTURE_CONTENT_MAX_AGE,
+            immutable=True,
+        )
+
+    def finish_content_response(
+        self, response, etag=None, content_encoding=None, decoded=False
+    ):
+        """Add validator, encoding and caching headers to a content response."""
+        if not decoded:
+            response["Accept-Ranges"] = "bytes"
+        if content_encoding:
+            if not decoded:
+                response["Content-Encoding"] = content_encoding
+            patch_vary_headers(response, ["Accept-Encoding"])
+        if etag:
+            response["ETag"] = etag
+        self.add_cache_headers(response)
+        return response
+
+    def build_content_response(
+        self, request, file_key, content_type, etag=None, content_encoding=None
+    ):
+        """
+        Fetch a file from S3 and build the HTTP response according to the
+        configured delivery mode.
+
+        Objects small enough for the blob cache are read whole and cached.
+        Larger ones are relayed chunk by chunk in "stream" mode so memory use
+        stays flat regardless of capture size; "buffer" mode reads them first.
+        ``Range`` requests bypass the cache and are forwarded to S3.
+
+        Objects stored gzip-compressed are passed through untouched when the
+        client accepts gzip, and decompressed on the fly otherwise (ignoring
+        ``Range``, whose offsets refer to the compressed object).
+        """
+        decode = content_encoding == "gzip" and not accepts_gzip(request)
+
+        byte_range = None if decode else request.META.get("HTTP_RANGE")
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if byte_range and if_range and if_range != etag:
+            # The client's partial copy is stale, send the full body instead
+            byte_range = None
+
+        if not byte_range:
+            cached = blob_cache.get(file_key)
+            if cached is not None:
+                if decode:
+                    cached = decode_stored_content(cached, content_encoding)
+                return self.finish_content_response(
+                    HttpResponse(cached, content_type=content_type),
+                    etag,
+                    content_encoding,
+                    decode,
+                )
+
+        try:
+            s3_response = get_s3_object(file_key, byte_range=byte_range)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                return HttpResponse(
+                    "Requested range not satisfiable",
+                    status=416,
+                    content_type="text/plain",
+                )
+            raise
+
+        etag = etag or s3_response.get("ETag")
+        not_modified = self.not_modified_response(request, etag)
+        if not_modified is not None:
+            s3_response["Body"].close()
+            return not_modified
+
+        body = s3_response["Body"]
+        http_response: HttpResponseBase
+
+        cacheable = not byte_range and blob_cache.accepts(
+            s3_response.get("ContentLength")
+        )
+
+        if cacheable or settings.CAPTURE_CONTENT_DELIVERY == "buffer":
+            content = body.read()
+            if cacheable:
+                blob_cache.set(file_key, content)
+            if decode:
+                content = decode_stored_content(content, content_encoding)
+            http_response = HttpResponse(content, content_type=content_type)
+        else:
+            chunks = iter_s3_body(body)
+            if decode:
+                chunks = iter_gunzip(chunks)
+            http_response = StreamingHttpResponse(chunks, content_type=content_type)
+            if s3_response.get("ContentLength") is not None and not decode:
+                http_response["Content-Length"] = s3_response["ContentLength"]
+
+        if s3_response.get("ContentRange"):
+            http_response.status_code = 206
+            http_response["Content-Range"] = s3_response["ContentRange"]
+
+        return self.finish_content_response(
+            http_response, etag, content_encoding, decode
+        )
+
+    def redirect_to_s3(self, file_key):
+        """Redirect the client to a presigned S3 URL for the given file."""
+        url = get_cached_s3_url(file_key)
+        if not url:
+            raise RuntimeError("could not generate a download URL")
+        return HttpResponseRedirect(url)
+
     def serve_html(self, request, slug=None):
         """Serve the HTML content of the capture."""
         try:
@@ -109,6 +400,9 @@ class CaptureDetailView(RetrieveAPIView):
                     content_type="text/plain",
                 )
 
+            if capture.status != Capture.Status.READY:
+                return self.not_ready_response(capture)
+
             if not capture.html_file_key:
                 return HttpResponse(
                     "HTML file not found for this capture",
@@ -116,16 +410,32 @@ class CaptureDetailView(RetrieveAPIView):
                     content_type="text/plain",
                 )
 
-            # Get HTML content from S3
-            response = s3_client.get_object(
-                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=capture.html_file_key
+            # Compressed HTML is sent as-is to clients that accept gzip, and
+            # that representation gets its own ETag
+            content_encoding = capture.html_content_encoding
+            send_encoded = content_encoding == "gzip" and accepts_gzip(request)
+            etag = None
+            if capture.html_sha256:
+                suffix = f"-{content_encoding}" if send_encoded else ""
+                etag = quote_etag(f"{capture.html_sha256}{suffix}")
+            not_modified = self.not_modified_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+
+            if settings.CAPTURE_CONTENT_DELIVERY == "redirect" and (
+                not content_encoding or send_encoded
+            ):
+                return self.redirect_to_s3(capture.html_file_key)
+
+            # Return HTML from S3 (bytes are already UTF-8, no need to decode)
+            return self.build_content_response(
+                request,
+                capture.html_file_key,
+                content_type="text/html; charset=utf-8",
+                etag=etag,
+                content_encoding=content_encoding,
             )
 
-            html_content = response["Body"].read().decode("utf-8")
-
-            # Return HTML response
-            return HttpResponse(html_content, content_type="text/html; charset=utf-8")
-
         except Exception as e:
             return HttpResponse(
                 f"Error retrieving HTML: {str(e)}",
@@ -134,7 +444,10 @@ class CaptureDetailView(RetrieveAPIView):
             )
 
     def serve_image(self, request, slug=None):
-        """Serve the PNG image of the capture."""
+        """
+        Serve the PNG image of the capture, or a downscaled variant of it when
+        ``?variant=`` names one of CAPTURE_IMAGE_VARIANTS.
+        """
         try:
             capture = self.get_object()
 
@@ -146,6 +459,9 @@ class CaptureDetailView(RetrieveAPIView):
                     content_type="text/plain",
                 )
 
+            if capture.status != Capture.Status.READY:
+                return self.not_ready_response(capture)
+
             if not capture.png_file_key:
                 return HttpResponse(
                     "Image file not found for this capture",
@@ -153,15 +469,51 @@ class CaptureDetailView(RetrieveAPIView):
                     content_type="text/plain",
                 )
 
-            # Get PNG content from S3
-            response = s3_client.get_object(
-                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=capture.png_file_key
-            )
-
-            png_content = response["Body"].read()
-
-            # Return PNG response
-            return HttpResponse(png_content, content_type="image/png")
+            # Optionally serve a downscaled variant in the best format the
+            # client accepts instead of the full-size PNG
+            variant = request.GET.get("variant")
+            if variant and variant not in settings.CAPTURE_IMAGE_VARIANTS:
+                return HttpResponse(
+                    f"Unknown image variant: {variant}",
+                    status=400,
+                    content_type="text/plain",
+                )
+            image_service = ImageVariantService()
+            if not image_service.is_available():
+                variant = None
+
+            etag_value = capture.png_sha256
+            if variant:
+                image_format = image_service.choose_format(
+                    request.META.get("HTTP_ACCEPT", "")
+                )
+                if etag_value:
+                    variant_name = image_service.variant_name(variant, image_format)
+                    etag_value = f"{etag_value}-{variant_name}"
+
+            etag = quote_etag(etag_value) if etag_value else None
+            not_modified = self.not_modified_response(request, etag)
+            if not_modified is not None:
+                if variant:
+                    patch_vary_headers(not_modified, ["Accept"])
+                return not_modified
+
+            file_key = capture.png_file_key
+            content_type = "image/png"
+            if variant:
+                file_key = image_service.get_variant(capture, variant, image_format)
+                content_type = image_service.content_type(image_format)
+
+            if settings.CAPTURE_CONTENT_DELIVERY == "redirect":
+                response = self.redirect_to_s3(file_key)
+            else:
+                # Return the image from S3
+                response = self.build_content_response(
+                    request, file_key, content_type=content_type, etag=etag
+                )
+            if variant:
+                patch_vary_headers(response, ["Accept"])
+            return response
 
         except Exception as e:
             return HttpResponse(
@@ -0,0 +1,65 @@
+"""
+Middleware recording how often requests reuse a database connection.
+With persistent connections most requests in a worker should find the
+connection left open by an earlier request on the same thread.
+"""
+
+import os
+import threading
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+class ConnectionStats:
+    """Per-process counters of requests and database connections opened."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.reused = 0
+        self.connections_opened = 0
+
+    def record_request(self, reused):
+        with self._lock:
+            self.requests += 1
+            if reused:
+                self.reused += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def stats(self):
+        """Return the counters and the share of requests that reused a connection."""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "requests": self.requests,
+                "reused_connections": self.reused,
+                "connections_opened": self.connections_opened,
+                "reuse_ratio": (
+                    round(self.reused / self.requests, 3) if self.requests else 0
+                ),
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs) -> None:
+    connection_stats.record_connection()
+
+
+class ConnectionStatsMiddleware:
+    """Count requests that start with an already open database connection."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Connections past CONN_MAX_AGE (or unusable ones) were already closed
+        # by the request_started handler, so an open one here is being reused
+        connection_stats.record_request(reused=connection.connection is not None)
+        return self.get_response(request)
@@ -2,6 +2,9 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
+from captures.blob_cache import blob_cache
+from core.middleware import connection_stats
+
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -11,6 +14,8 @@ def health_check(request):
         {
             "status": "healthy",
             "message": "Service is running",
+            "blob_cache": blob_cache.stats(),
+            "database": connection_stats.stats(),
         },
         status=200,
     )
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from captures.models import Capture
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every user's stored capture count from the captures table, "
+        "leaving out failed captures and adding the ones users deleted."
+    )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+
+        num_captures = (
+            Capture.objects.filter(user=OuterRef("pk"))
+            .exclude(status=Capture.Status.FAILED)
+            .order_by()
+            .values("user")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        expected = Coalesce(Subquery(num_captures), 0) + F("deleted_capture_count")
+
+        # Count and write in one UPDATE, so slots reserved by concurrent
+        # creates are not overwritten with a count read earlier
+        fixed = User.objects.exclude(capture_count=expected).update(
+            capture_count=expected
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Reconciled capture counts for {fixed} user(s)")
+        )
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_capture_counts(apps, schema_editor):
+    CustomUser = apps.get_model("users", "CustomUser")
+    counts = CustomUser.objects.annotate(num_captures=Count("captures")).filter(
+        num_captures__gt=0
+    )
+    for user in counts.only("pk").iterator():
+        CustomUser.objects.filter(pk=user.pk).update(capture_count=user.num_captures)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0010_customuser_source"),
+        ("captures", "0008_blob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="capture_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of captures created by this user"
+            ),
+        ),
+        migrations.RunPython(backfill_capture_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-17 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0011_customuser_capture_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="deleted_capture_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of captures deleted by this user"
+            ),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from typing import Optional
 
 
@@ -21,6 +24,19 @@ class CustomUser(AbstractUser):
         default=10, help_text="Number of free captures allowed for this user"
     )
 
+    # Number of captures created by this user, reserved atomically before a
+    # capture is created and decremented when its upload fails or an admin
+    # deletes it, so quota checks don't need a COUNT(*) over captures
+    capture_count = models.PositiveIntegerField(
+        default=0, help_text="Number of captures created by this user"
+    )
+
+    # Number of captures deleted by this user, which keep counting against
+    # the limit like archived ones
+    deleted_capture_count = models.PositiveIntegerField(
+        default=0, help_text="Number of captures deleted by this user"
+    )
+
     # Source field to track where the user came from
     source = models.CharField(
         max_length=100,
@@ -49,7 +65,30 @@ class CustomUser(AbstractUser):
 
     def get_capture_count(self) -> int:
         """Get the total number of captures for this user."""
-        return self.captures.count()  # type: ignore[attr-defined]
+        return self.capture_count
+
+    def reserve_capture_slot(self) -> bool:
+        """
+        Atomically claim one capture slot if the user is under their limit.
+
+        The limit check and the counter increment happen in a single
+        conditional UPDATE, so concurrent creates cannot exceed the limit.
+        """
+        reserved = (
+            type(self)
+            .objects.filter(pk=self.pk, capture_count__lt=F("free_capture_limit"))
+            .update(capture_count=F("capture_count") + 1)
+        )
+        if reserved:
+            self.capture_count += 1
+        return bool(reserved)
+
+    def release_capture_slot(self) -> None:
+        """Give back a slot claimed by reserve_capture_slot."""
+        type(self).objects.filter(pk=self.pk, capture_count__gt=0).update(
+            capture_count=F("capture_count") - 1
+        )
+        self.capture_count = max(0, self.capture_count - 1)
 
     def can_create_capture(self) -> bool:
         """Check if user can create a new capture based on their free tier limit."""
@@ -61,3 +100,11 @@ class CustomUser(AbstractUser):
         capture_count = self.get_capture_count()
         remaining = self.free_capture_limit - capture_count
         return max(0, remaining)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_profile(sender, instance, **kwargs) -> None:
+    """Drop the cached profile whenever the user is saved, e.g. on login."""
+    from users.profile_cache import invalidate_profile
+
+    invalidate_profile(instance.pk)
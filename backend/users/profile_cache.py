@@ -0,0 +1,52 @@
+"""
+Cache of rendered user profiles.
+The extension loads the profile every time its popup opens, so the serialized
+profile and its ETag are kept in the Django cache until the user or their
+captures change.
+"""
+
+import hashlib
+import json
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from users.serializers import UserProfileSerializer
+
+User = get_user_model()
+
+
+def profile_cache_key(user_id):
+    """Return the cache key of a user's profile."""
+    return f"user-profile:{user_id}"
+
+
+def get_profile(user_id):
+    """
+    Get a user's serialized profile, rendering and caching it on a miss.
+
+    Args:
+        user_id (int): The primary key of the user
+
+    Returns:
+        dict: ``{"data": <profile>, "etag": <str>}``
+    """
+    key = profile_cache_key(user_id)
+    profile = cache.get(key)
+    if profile is not None:
+        return profile
+
+    user = UserProfileSerializer.setup_queryset(User.objects.all()).get(pk=user_id)
+    data = dict(UserProfileSerializer(user).data)
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    profile = {
+        "data": data,
+        "etag": hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32],
+    }
+    cache.set(key, profile, settings.USER_PROFILE_CACHE_TTL)
+    return profile
+
+
+def invalidate_profile(user_id):
+    """Drop a user's cached profile so the next read renders it afresh."""
+    cache.delete(profile_cache_key(user_id))
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery
+from capture_mcp_server.models import MCPUrl
 
 User = get_user_model()
 
@@ -32,6 +34,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     full_name = serializers.ReadOnlyField()
     mcp_url = serializers.SerializerMethodField()
+    subscription_status = serializers.SerializerMethodField()
+    subscription_plan = serializers.SerializerMethodField()
     capture_count = serializers.SerializerMethodField()
     remaining_free_captures = serializers.SerializerMethodField()
     can_create_capture = serializers.SerializerMethodField()
@@ -70,13 +74,47 @@ class UserProfileSerializer(serializers.ModelSerializer):
             "free_capture_limit",
         ]
 
+    @staticmethod
+    def setup_queryset(queryset):
+        """
+        Annotate everything the serializer needs onto a user queryset.
+
+        The active MCP URL token is loaded with a subquery and the capture
+        figures come from the stored ``capture_count``, so a user fetched from
+        the returned queryset is serialized without further queries.
+
+        Args:
+            queryset (QuerySet): A queryset of users
+
+        Returns:
+            QuerySet: The annotated queryset
+        """
+        mcp_urls = MCPUrl.objects.filter(user=OuterRef("pk"), is_active=True)
+        return queryset.annotate(
+            mcp_url_token=Subquery(
+                mcp_urls.order_by("-created_at").values("url_token")[:1]
+            )
+        )
+
     def get_mcp_url(self, obj):
         """Get the MCP URL for the user."""
+        url_token = getattr(obj, "mcp_url_token", None)
+        if url_token:
+            return MCPUrl.build_mcp_url(url_token)
+
         try:
             return obj.get_mcp_url()
         except Exception:
             return None
 
+    def get_subscription_status(self, obj):
+        """Subscriptions are not tracked, kept for API compatibility."""
+        return None
+
+    def get_subscription_plan(self, obj):
+        """Subscriptions are not tracked, kept for API compatibility."""
+        return None
+
     def get_capture_count(self, obj):
         """Get the total number of captures for this user."""
         return obj.get_capture_count()
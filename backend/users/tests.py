@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from .models import CustomUser
+from .serializers import UserProfileSerializer
+
+
+class UserProfileQueryTests(TestCase):
+    """The profile endpoint must not grow extra queries per request."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        CustomUser.objects.filter(pk=self.user.pk).update(capture_count=3)
+
+    def test_profile_is_serialized_from_one_query(self):
+        with self.assertNumQueries(1):
+            user = UserProfileSerializer.setup_queryset(CustomUser.objects.all()).get(
+                pk=self.user.pk
+            )
+            data = UserProfileSerializer(user).data
+
+        self.assertEqual(data["capture_count"], 3)
+        self.assertEqual(data["remaining_free_captures"], user.free_capture_limit - 3)
+        self.assertTrue(data["can_create_capture"])
+        self.assertIn(self.user.mcp_urls.get().url_token, data["mcp_url"])
+
+    def test_get_user_query_count(self):
+        self.client.force_login(self.user)
+
+        # Session and authenticated user lookups, plus the profile query
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("users:get_user"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["capture_count"], 3)
+
+
+class UserProfileCacheTests(TestCase):
+    """The profile is cached per user and revalidated with its ETag."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="user@example.com", email="user@example.com", password="x"
+        )
+        self.client.force_login(self.user)
+
+    def test_cached_profile_is_served_without_profile_query(self):
+        self.client.get(reverse("users:get_user"))
+
+        # Only the session and authenticated user lookups remain
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("users:get_user"))
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_revalidation(self):
+        response = self.client.get(reverse("users:get_user"))
+        etag = response["ETag"]
+
+        response = self.client.get(reverse("users:get_user"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.patch(
+            reverse("users:update_user_source"),
+            {"source": "extension"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["source"], "extension")
+
+        response = self.client.get(reverse("users:get_user"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
@@ -2,15 +2,27 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .serializers import UserProfileSerializer, UserSourceUpdateSerializer
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from .profile_cache import get_profile
+from .serializers import UserSourceUpdateSerializer
 
 User = get_user_model()
 
 
 @api_view(["GET"])
 def get_user(request):
-    serializer = UserProfileSerializer(request.user)
-    return Response(serializer.data)
+    """Get the current user's profile, served from the cache when possible."""
+    profile = get_profile(request.user.pk)
+    etag = quote_etag(profile["etag"])
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(profile["data"])
+    response["ETag"] = etag
+    # Let the client keep the profile but revalidate it on every popup open
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @api_view(["PATCH"])
@@ -23,7 +35,6 @@ def update_user_source(request):
         serializer.update(request.user, serializer.validated_data)
 
         # Return updated user profile
-        user_serializer = UserProfileSerializer(request.user)
-        return Response(user_serializer.data, status=status.HTTP_200_OK)
+        return Response(get_profile(request.user.pk)["data"], status=status.HTTP_200_OK)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)